@@ -0,0 +1,130 @@
+import json
+import os
+import time
+
+from binary_recording import BinarySink
+from calibration import Calibration
+from device_manager import Device, DeviceManager, device_parameters_path
+from parameter_manager import ParameterManager
+from recorder import Recorder, CsvSink
+from serial_manager import SerialManager
+
+# Recording file formats by name: CSV for spreadsheets, binary for long memory-mappable recordings
+RECORDING_SINKS = {"csv": CsvSink, "binary": BinarySink}
+
+
+# Functie om parameters uit een bestand te lezen
+def read_parameters(file_path):
+    with open(file_path, 'r') as file:
+        return json.load(file)
+
+
+# Functie om parameters naar een bestand te schrijven
+def write_parameters(file_path, parameters):
+    with open(file_path, 'w') as file:
+        json.dump(parameters, file, indent=4)
+
+
+def build_device_manager(parameters, parameters_file_path, calibration=None, replay_source=None, ports=None):
+    """Create the devices to acquire from: a replay, the given ports or every connected board.
+
+    The first device uses calibration (by default one built from parameters); the other boards use
+    parameters_<port>.json next to parameters_file_path when it exists.
+    """
+    if calibration is None:
+        calibration = Calibration.from_parameters(parameters)
+    if replay_source is not None:
+        # A recording takes the place of the device; it is fed through the same ingest path
+        return DeviceManager([Device(replay_source, "replay", calibration)])
+    if ports is None:
+        ports = SerialManager().find_esp32_ports()
+    if not ports:
+        # Nothing found yet: a single device that reports why it cannot connect
+        return DeviceManager([Device(ParameterManager(SerialManager()), "esp32", calibration)])
+    devices = [Device.on_port(ports[0], calibration)]
+    for port in ports[1:]:
+        device = Device.on_port(port, None)
+        device_path = device_parameters_path(parameters_file_path, device.label)
+        device.calibration = Calibration.from_parameters(
+            read_parameters(device_path) if os.path.exists(device_path) else parameters)
+        devices.append(device)
+    return DeviceManager(devices)
+
+
+class Acquisition:
+    """Polling, calibration and recording of all devices, without any user interface.
+
+    poll() hands the complete, calibrated samples of every device to that device's recorder while recording
+    and returns the batches to the caller, so the GUI and the headless entry point share the same pipeline.
+    contacts is written into every recorded row.
+    """
+
+    def __init__(self, device_manager, directory='.', sink_class=CsvSink):
+        self.device_manager = device_manager
+        multiple_devices = len(device_manager) > 1
+        # One recorder and so one set of files per device
+        self.recorders = [Recorder(directory, f"recording_{device.label}" if multiple_devices else "recording",
+                                   sink_class=sink_class) for device in device_manager.devices]
+        self.contacts = 0
+        self.started_at = time.monotonic()
+        self.updates_received = 0
+        self.samples_received = 0
+
+    def open(self, binary_mode=False):
+        self.device_manager.open_serial_connection(binary_mode=binary_mode)
+        self.started_at = time.monotonic()
+
+    def close(self):
+        # Flush and close the recordings, then the serial connections
+        self.stop_recording()
+        self.device_manager.close_serial_connection()
+
+    def start_recording(self):
+        for recorder in self.recorders:
+            recorder.start()
+
+    def stop_recording(self):
+        for recorder in self.recorders:
+            recorder.stop()
+
+    def is_recording(self):
+        return self.recorders[0].is_recording()
+
+    def poll(self):
+        batches = self.device_manager.poll()
+        contacts = self.contacts
+        for batch, recorder in zip(batches, self.recorders):
+            self.updates_received += len(batch.updates)
+            if not batch.raw:
+                continue
+            self.samples_received += len(batch.raw)
+            if recorder.is_recording():
+                recorder.add_samples([(timestamp, contacts) + raw + res for timestamp, raw, res
+                                      in zip(batch.timestamps, batch.raw, map(tuple, batch.res.tolist()))])
+        return batches
+
+    def get_statistics(self):
+        """Totals since open(): samples, records, recorded samples and records lost on the way, per device too.
+
+        Per device also the current backlog: bytes waiting in the OS buffer and records queued by the reader.
+        """
+        devices = {}
+        for device, recorder in zip(self.device_manager.devices, self.recorders):
+            parameter_manager = device.parameter_manager
+            serial_manager = getattr(parameter_manager, "serial_manager", None)
+            parser = serial_manager.parser if serial_manager else None
+            in_waiting, queued = serial_manager.get_backlog() if serial_manager else (0, 0)
+            devices[device.label] = {
+                "in_waiting": in_waiting,
+                "queued": queued,
+                "dropped": serial_manager.dropped_samples if serial_manager else 0,
+                "parse_errors": parser.errors if parser else 0,
+                "lost_frames": getattr(parser, "lost_frames", 0),
+                "recorded": recorder.samples_written,
+            }
+        return {
+            "elapsed": time.monotonic() - self.started_at,
+            "samples": self.samples_received,
+            "updates": self.updates_received,
+            "devices": devices,
+        }
@@ -0,0 +1,350 @@
+"""Benchmarks for ingest, calibration and rendering.
+
+Runs without a display (SDL dummy video driver) and can write the results as JSON to compare revisions:
+
+    python benchmark.py --json results.json
+    python benchmark.py --quick --only parser,scope
+"""
+import argparse
+import datetime
+import io
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from calibration import Calibration, LinearModel, PolynomialModel, PiecewiseLinearModel
+from line_parser import LineParser, FrameParser, encode_frame
+
+# Number of lines in the synthetic ADC stream
+NR_OF_LINES = 200000
+# Size of the chunks handed to the chunked parser, roughly what in_waiting returns at 115200 baud
+CHUNK_SIZE = 4096
+# Samples per calibration batch, about one frame's worth at high sample rates
+CALIBRATION_BATCH = 1024
+NR_OF_CALIBRATION_SAMPLES = 1000000
+# Scope benchmark grid
+SCOPE_CHANNELS = (1, 4, 8, 16)
+SCOPE_TIME_SCALES = (-2, 0, 4, 8, 12)
+# Frames timed per rendering measurement
+NR_OF_FRAMES = 200
+# Samples arriving per frame in the end-to-end benchmark (860 SPS at 60 fps is about 15)
+FRAME_SAMPLE_COUNTS = (16, 256, 4096)
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+led_font_path = os.path.join(current_dir, 'fonts', 'ds_digital', 'DS-DIGII.TTF')
+
+
+def make_stream(nr_of_lines=NR_OF_LINES):
+    # Same format as the ESP32 firmware: "adcN value\r\n" for the four channels in turn
+    return b"".join(b"adc%d %d\r\n" % (i % 4, 10000 + (i * 37) % 20000) for i in range(nr_of_lines))
+
+
+def make_frame_stream(nr_of_lines=NR_OF_LINES):
+    # The same samples as make_stream(), packed four channels per binary frame
+    return b"".join(encode_frame(i, [10000 + ((i * 4 + ch) * 37) % 20000 for ch in range(4)])
+                    for i in range(nr_of_lines // 4))
+
+
+class BufferedPort:
+    """Minimal stand-in for serial.Serial that serves a byte string, used to time the old readline path.
+
+    readline() reads one byte at a time like pyserial's read_until() does, minus the system call per byte.
+    """
+
+    def __init__(self, data):
+        self.stream = io.BytesIO(data)
+        self.size = len(data)
+
+    @property
+    def in_waiting(self):
+        return self.size - self.stream.tell()
+
+    def read(self, size=1):
+        return self.stream.read(size)
+
+    def readline(self):
+        line = bytearray()
+        while True:
+            c = self.read(1)
+            if not c:
+                break
+            line += c
+            if c == b'\n':
+                break
+        return bytes(line)
+
+
+def parse_readline(data):
+    # The per-line path check_parameter_updates() used before the chunked parser
+    port = BufferedPort(data)
+    parameter_updates = []
+    while port.in_waiting:
+        received_data = port.readline().decode().strip()
+        if received_data:
+            parts = received_data.split(' ')
+            if len(parts) == 2:
+                parameter_name, parameter_value = parts
+                parameter_updates.append((parameter_name, parameter_value))
+    return parameter_updates
+
+
+def parse_chunked(data, chunk_size=CHUNK_SIZE):
+    parser = LineParser()
+    records = []
+    for start in range(0, len(data), chunk_size):
+        records.extend(parser.feed(data[start:start + chunk_size], 0.0))
+    return records
+
+
+def parse_frames(data, chunk_size=CHUNK_SIZE):
+    parser = FrameParser()
+    records = []
+    for start in range(0, len(data), chunk_size):
+        records.extend(parser.feed(data[start:start + chunk_size], 0.0))
+    return records
+
+
+def bench_parser(nr_of_lines=NR_OF_LINES, repeat=3):
+    text = make_stream(nr_of_lines)
+    frames = make_frame_stream(nr_of_lines)
+    results = {}
+    for name, parse, data in (("readline", parse_readline, text), ("chunked", parse_chunked, text),
+                              ("frames", parse_frames, frames)):
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            parsed = parse(data)
+            best = min(best, time.perf_counter() - start)
+        assert len(parsed) == nr_of_lines
+        results[name] = nr_of_lines / best
+    return results
+
+
+def bench_calibration(nr_of_samples=NR_OF_CALIBRATION_SAMPLES, batch=CALIBRATION_BATCH, repeat=3):
+    raw = np.random.default_rng(0).integers(-32768, 32767, size=(nr_of_samples, 4))
+    batches = [raw[start:start + batch] for start in range(0, nr_of_samples, batch)]
+    calibrations = {
+        "linear": Calibration([LinearModel(2.0, 100.0)] * 4),
+        "mixed": Calibration([LinearModel(2.0, 100.0), PolynomialModel([1e-6, 0.5, 3.0]),
+                              PiecewiseLinearModel([(-32768, -10.0), (0, 0.0), (32767, 12.0)]),
+                              LinearModel(4.0, 0.0)]),
+    }
+    results = {}
+    for name, calibration in calibrations.items():
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for samples in batches:
+                calibration.apply(samples)
+            best = min(best, time.perf_counter() - start)
+        results[name] = nr_of_samples / best
+    return results
+
+
+def init_display(size=(1920, 1080)):
+    # Imported here so the parser and calibration benchmarks run without pygame
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    import pygame
+    pygame.init()
+    return pygame.display.set_mode(size)
+
+
+def time_frames(draw, nr_of_frames=NR_OF_FRAMES):
+    # Mean and worst time per call in milliseconds
+    times = []
+    for _ in range(nr_of_frames):
+        start = time.perf_counter()
+        draw()
+        times.append(time.perf_counter() - start)
+    return {"mean_ms": 1000 * sum(times) / len(times), "max_ms": 1000 * max(times)}
+
+
+def make_signal(nr_of_samples, channel):
+    k = np.arange(nr_of_samples)
+    return 20 * np.sin(k / (40 + 10 * channel)) + 5 * np.sin(k / 3.0)
+
+
+def bench_scope(channels=SCOPE_CHANNELS, time_scales=SCOPE_TIME_SCALES, nr_of_frames=NR_OF_FRAMES):
+    screen = init_display()
+    from graphic_interface import Scope
+    results = {}
+    for nr_of_channels in channels:
+        scope = Scope(1125, 20, 750, 600)
+        for channel in range(nr_of_channels):
+            scope.add_signal(offset=0, val_per_division=10)
+        # Enough history to fill the screen at the coarsest time scale
+        nr_of_samples = scope.width * 2 ** max(max(time_scales), 0)
+        for channel in range(nr_of_channels):
+            scope.add_values_to_signal(channel, make_signal(nr_of_samples, channel))
+        for time_scale in time_scales:
+            scope.set_time_scale(time_scale)
+            results[f"{nr_of_channels}ch/ts{time_scale}"] = time_frames(lambda: scope.draw(screen), nr_of_frames)
+    return results
+
+
+def bench_widgets(nr_of_frames=NR_OF_FRAMES):
+    screen = init_display()
+    from graphic_interface import TerminalWindow, TextField, text_cache
+    results = {}
+
+    terminal = TerminalWindow(50, 620, 500, 270)
+    terminal.add_messages([f"adc{i % 4} {10000 + i}" for i in range(terminal.visible_lines)])
+    results["terminal_draw"] = time_frames(lambda: terminal.draw(screen), nr_of_frames)
+    counter = iter(range(10 ** 9))
+
+    def add_and_draw():
+        i = next(counter)
+        terminal.add_messages([f"adc{channel} {i * 4 + channel}" for channel in range(4)])
+        terminal.draw(screen)
+    results["terminal_add4_draw"] = time_frames(add_and_draw, nr_of_frames)
+
+    field = TextField(150, 40, 120, 45, font=led_font_path, font_size=40)
+    field.set_value(12345)
+    results["text_field_draw_same"] = time_frames(lambda: field.draw(screen), nr_of_frames)
+
+    def set_and_draw():
+        # A new value every frame: nothing can be reused
+        text_cache.clear()
+        field.set_value(next(counter))
+        field.draw(screen)
+    results["text_field_draw_new"] = time_frames(set_and_draw, nr_of_frames)
+    return results
+
+
+class SyntheticSource:
+    """Stands in for a ParameterManager and delivers samples_per_frame four-channel samples per call."""
+
+    def __init__(self, samples_per_frame):
+        self.samples_per_frame = samples_per_frame
+        self.k = 0
+
+    def check_parameter_updates(self):
+        records = []
+        append = records.append
+        timestamp = time.monotonic()
+        for k in range(self.k, self.k + self.samples_per_frame):
+            for channel in range(4):
+                append((timestamp, f"adc{channel}", int(10000 + 8000 * math.sin(k / 50 + channel))))
+        self.k += self.samples_per_frame
+        return records
+
+
+def bench_frame(sample_counts=FRAME_SAMPLE_COUNTS, nr_of_frames=NR_OF_FRAMES):
+    """Ingest, calibration, widget updates, dirty rendering and display update, like one iteration of main()."""
+    screen = init_display()
+    import pygame
+    from graphic_interface import Scope, TerminalWindow, TextField, DirtyRenderer
+    from device_manager import Device, DeviceManager
+    results = {}
+    for samples_per_frame in sample_counts:
+        calibration = Calibration([LinearModel(2.0, 100.0)] * 4)
+        device_manager = DeviceManager([Device(SyntheticSource(samples_per_frame), "synthetic", calibration)])
+        scope = Scope(1125, 20, 750, 600)
+        for channel in range(4):
+            scope.add_signal(offset=0, val_per_division=10000)
+        terminal = TerminalWindow(575, 620, 500, 270)
+        adc_fields = [TextField(150 + i * 200, 40, 120, 45, font=led_font_path, font_size=40) for i in range(4)]
+        res_fields = [TextField(150 + i * 200, 340, 120, 45, font=led_font_path, font_size=40) for i in range(4)]
+        renderer = DirtyRenderer((60, 59, 57))
+        renderer.add(*adc_fields, *res_fields, terminal, scope)
+
+        def frame():
+            for batch in device_manager.poll():
+                terminal.add_messages([f"{name} {value}" for _, name, value in batch.updates])
+                for i, raw_value in enumerate(batch.device.raw_sample):
+                    adc_fields[i].set_value(raw_value)
+                if batch.raw:
+                    for i in range(4):
+                        res_fields[i].set_value(round(float(batch.res[-1, i]), 2))
+                        scope.add_values_to_signal(i, batch.res[:, i])
+            rects = renderer.draw(screen)
+            if rects:
+                pygame.display.update(rects)
+        frame()  # The first frame redraws everything
+        results[f"{samples_per_frame}_samples"] = time_frames(frame, nr_of_frames)
+    return results
+
+
+BENCHMARKS = {
+    "parser": bench_parser,
+    "calibration": bench_calibration,
+    "scope": bench_scope,
+    "widgets": bench_widgets,
+    "frame": bench_frame,
+}
+# Smaller workloads for a fast check
+QUICK_ARGUMENTS = {
+    "parser": {"nr_of_lines": 20000, "repeat": 1},
+    "calibration": {"nr_of_samples": 100000, "repeat": 1},
+    "scope": {"channels": (1, 4), "time_scales": (0, 8), "nr_of_frames": 20},
+    "widgets": {"nr_of_frames": 20},
+    "frame": {"sample_counts": (16, 1024), "nr_of_frames": 20},
+}
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=current_dir, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(names, quick=False):
+    results = {}
+    for name in names:
+        print(f"Running {name}...", file=sys.stderr)
+        results[name] = BENCHMARKS[name](**(QUICK_ARGUMENTS[name] if quick else {}))
+    return results
+
+
+def print_results(results):
+    units = {"parser": "lines/s", "calibration": "samples/s"}
+    for benchmark, values in results.items():
+        print(benchmark)
+        for name, value in values.items():
+            if isinstance(value, dict):
+                print(f"  {name:>24}: {value['mean_ms']:8.3f} ms mean {value['max_ms']:8.3f} ms max")
+            else:
+                print(f"  {name:>24}: {value:14,.0f} {units[benchmark]}")
+    if "parser" in results:
+        print(f"  {'chunked speedup':>24}: {results['parser']['chunked'] / results['parser']['readline']:.1f}x")
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Ingest, calibration and rendering benchmarks")
+    parser.add_argument("--only", help=f"Comma-separated subset of: {', '.join(BENCHMARKS)}")
+    parser.add_argument("--quick", action="store_true", help="Smaller workloads for a fast check")
+    parser.add_argument("--json", metavar="FILE", help="Also write the results to this JSON file")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    names = args.only.split(",") if args.only else list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        sys.exit(f"Unknown benchmark(s): {', '.join(unknown)}")
+    results = run_benchmarks(names, args.quick)
+    print_results(results)
+    if args.json:
+        report = {
+            "revision": git_revision(),
+            "date": datetime.datetime.now().isoformat(timespec='seconds'),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            # Only loaded by the rendering benchmarks
+            "pygame": sys.modules["pygame"].version.ver if "pygame" in sys.modules else None,
+            "quick": args.quick,
+            "results": results,
+        }
+        with open(args.json, 'w') as file:
+            json.dump(report, file, indent=4)
+        print(f"Written {args.json}")
@@ -0,0 +1,142 @@
+import argparse
+import json
+import os
+
+import numpy as np
+
+from recorder import CsvSink
+
+# One fixed-width record per sample, in the column order of recorder.SAMPLE_FIELDS
+RECORD_DTYPE = np.dtype([
+    ('monotonic', '<f8'), ('contacts', '<u4'),
+    ('adc0', '<i4'), ('adc1', '<i4'), ('adc2', '<i4'), ('adc3', '<i4'),
+    ('res0', '<f8'), ('res1', '<f8'), ('res2', '<f8'), ('res3', '<f8'),
+])
+# Sidecar index: one entry per chunk with its time range and position in the data file
+INDEX_DTYPE = np.dtype([('t_first', '<f8'), ('t_last', '<f8'), ('offset', '<i8'), ('count', '<i8')])
+
+MAGIC = b'ADSREC1\n'
+HEADER_SIZE = 512  # Magic plus a JSON description, padded so the records start at a fixed offset
+CHUNK_ROWS = 4096  # Rows collected before a chunk is appended to the file and the index
+INDEX_EXTENSION = '.idx'
+
+
+def index_path(path):
+    return path + INDEX_EXTENSION
+
+
+class BinarySink:
+    """Recording file with fixed-width binary records that can be opened with numpy.memmap.
+
+    Rows are buffered and appended in chunks of CHUNK_ROWS. For every chunk an entry with its first and last
+    timestamp, byte offset and row count is appended to the sidecar index, so a time window can be located
+    without reading the data file. Can be used as the Recorder's sink_class.
+    """
+
+    extension = '.adsrec'
+
+    def __init__(self, path, wall_clock_offset):
+        self.path = path
+        self.wall_clock_offset = wall_clock_offset
+        self.rows = []
+        self.file = open(path, mode='wb')
+        self.index_file = open(index_path(path), mode='wb')
+        header = json.dumps({
+            'dtype': RECORD_DTYPE.descr,
+            'wall_clock_offset': wall_clock_offset,
+        }).encode()
+        if len(MAGIC) + len(header) > HEADER_SIZE:
+            raise ValueError("Recording header too large")
+        self.file.write((MAGIC + header).ljust(HEADER_SIZE, b' '))
+
+    def write(self, samples):
+        self.rows.extend(samples)
+        if len(self.rows) >= CHUNK_ROWS:
+            self.flush_chunk()
+
+    def flush_chunk(self):
+        if not self.rows:
+            return
+        chunk = np.array(self.rows, dtype=RECORD_DTYPE)
+        self.rows = []
+        entry = np.array([(chunk['monotonic'][0], chunk['monotonic'][-1], self.file.tell(), len(chunk))],
+                         dtype=INDEX_DTYPE)
+        self.file.write(chunk.tobytes())
+        self.index_file.write(entry.tobytes())
+
+    def size(self):
+        return self.file.tell() + len(self.rows) * RECORD_DTYPE.itemsize
+
+    def close(self):
+        self.flush_chunk()
+        self.file.close()
+        self.index_file.close()
+
+
+def read_header(path):
+    with open(path, 'rb') as file:
+        header = file.read(HEADER_SIZE)
+    if not header.startswith(MAGIC):
+        raise ValueError(f"{path} is not a binary recording")
+    return json.loads(header[len(MAGIC):].decode())
+
+
+def open_recording(path):
+    """Return all records of a recording as a read-only numpy.memmap; nothing is read until it is sliced."""
+    read_header(path)
+    count = (os.path.getsize(path) - HEADER_SIZE) // RECORD_DTYPE.itemsize
+    if count == 0:
+        return np.zeros(0, dtype=RECORD_DTYPE)
+    return np.memmap(path, dtype=RECORD_DTYPE, mode='r', offset=HEADER_SIZE, shape=(count,))
+
+
+def load_index(path):
+    return np.fromfile(index_path(path), dtype=INDEX_DTYPE)
+
+
+def find_rows(index, t_start, t_end):
+    # Row range [first, last) of the chunks that overlap [t_start, t_end]
+    first_chunk = np.searchsorted(index['t_last'], t_start, side='left')
+    last_chunk = np.searchsorted(index['t_first'], t_end, side='right')
+    if first_chunk >= last_chunk:
+        return 0, 0
+    first = (index['offset'][first_chunk] - HEADER_SIZE) // RECORD_DTYPE.itemsize
+    last = (index['offset'][last_chunk - 1] - HEADER_SIZE) // RECORD_DTYPE.itemsize + index['count'][last_chunk - 1]
+    return int(first), int(last)
+
+
+def read_window(path, t_start, t_end, records=None, index=None):
+    """Return the records with t_start <= monotonic <= t_end as a view on the memory-mapped file."""
+    if records is None:
+        records = open_recording(path)
+    if index is None:
+        index = load_index(path)
+    first, last = find_rows(index, t_start, t_end)
+    # Only the chunks found through the index are touched to find the exact boundaries
+    timestamps = records['monotonic'][first:last]
+    start = first + np.searchsorted(timestamps, t_start, side='left')
+    stop = first + np.searchsorted(timestamps, t_end, side='right')
+    return records[start:stop]
+
+
+def convert_to_csv(path, csv_path=None, block_rows=65536):
+    """Write a binary recording in the CSV layout of recorder.CsvSink, block by block."""
+    if csv_path is None:
+        csv_path = os.path.splitext(path)[0] + CsvSink.extension
+    header = read_header(path)
+    records = open_recording(path)
+    sink = CsvSink(csv_path, header['wall_clock_offset'])
+    try:
+        for start in range(0, len(records), block_rows):
+            sink.write(records[start:start + block_rows].tolist())
+    finally:
+        sink.close()
+    return csv_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert a binary recording to CSV")
+    parser.add_argument("recording", help="Path of the .adsrec file")
+    parser.add_argument("-o", "--output", help="Path of the CSV file (default: next to the recording)")
+    args = parser.parse_args()
+    print(f"Written {convert_to_csv(args.recording, args.output)}")
@@ -0,0 +1,101 @@
+import numpy as np
+
+NR_OF_CHANNELS = 4
+
+
+class LinearModel:
+    """res = (adc - b) / a, the model behind the a/b fields of the calibration panel."""
+
+    def __init__(self, a=1.0, b=0.0):
+        self.a = float(a)
+        self.b = float(b)
+
+    def apply(self, raw):
+        return (raw - self.b) / self.a
+
+
+class PolynomialModel:
+    """res = c0 * adc**n + ... + cn, coefficients highest power first like numpy.polyval."""
+
+    def __init__(self, coefficients):
+        self.coefficients = np.asarray(coefficients, dtype=np.float64)
+
+    def apply(self, raw):
+        return np.polyval(self.coefficients, raw)
+
+
+class PiecewiseLinearModel:
+    """Lookup table of (adc, res) points with linear interpolation in between and clamping outside."""
+
+    def __init__(self, points):
+        points = np.asarray(sorted(points), dtype=np.float64)
+        self.adc = points[:, 0]
+        self.res = points[:, 1]
+
+    def apply(self, raw):
+        return np.interp(raw, self.adc, self.res)
+
+
+def model_from_parameters(parameters, channel):
+    # Optional "calibration": {"res0": {"model": "polynomial", "coefficients": [...]}, ...} section,
+    # channels without an entry use the linear a{i}/b{i} parameters
+    settings = parameters.get("calibration", {}).get(f"res{channel}")
+    if settings:
+        model = settings.get("model", "linear")
+        if model == "polynomial":
+            return PolynomialModel(settings["coefficients"])
+        if model == "table":
+            return PiecewiseLinearModel(settings["points"])
+        if model != "linear":
+            print(f"Unknown calibration model '{model}' for res{channel}, using linear")
+    return LinearModel(parameters.get(f"a{channel}", 1), parameters.get(f"b{channel}", 0))
+
+
+class CalibrationState:
+    """Immutable set of models plus the precomputed arrays used to apply them to a batch."""
+
+    def __init__(self, models):
+        self.models = tuple(models)
+        linear = [isinstance(model, LinearModel) for model in self.models]
+        self.all_linear = all(linear)
+        self.nonlinear_channels = [i for i, is_linear in enumerate(linear) if not is_linear]
+        # One broadcast (raw - offset) * scale handles every linear channel at once
+        self.offset = np.array([model.b if is_linear else 0.0 for model, is_linear in zip(self.models, linear)])
+        with np.errstate(divide='ignore'):
+            self.scale = np.array([1.0 / model.a if is_linear and model.a else (np.nan if is_linear else 1.0)
+                                   for model, is_linear in zip(self.models, linear)])
+
+
+class Calibration:
+    """Converts batches of raw ADC samples to calibrated values, one model per channel.
+
+    apply() takes an (n, channels) array. The models are kept in a CalibrationState that is replaced as a whole
+    when a coefficient changes, so a batch is always calibrated with one consistent set of models, also when
+    the UI edits them while another thread is calibrating.
+    """
+
+    def __init__(self, models):
+        self.state = CalibrationState(models)
+
+    @classmethod
+    def from_parameters(cls, parameters, nr_of_channels=NR_OF_CHANNELS):
+        return cls([model_from_parameters(parameters, i) for i in range(nr_of_channels)])
+
+    def load_parameters(self, parameters):
+        self.state = CalibrationState(model_from_parameters(parameters, i) for i in range(len(self.state.models)))
+
+    def set_model(self, channel, model):
+        models = list(self.state.models)
+        models[channel] = model
+        self.state = CalibrationState(models)
+
+    def get_model(self, channel):
+        return self.state.models[channel]
+
+    def apply(self, raw):
+        state = self.state  # Read once: a concurrent update swaps in a new state
+        raw = np.asarray(raw, dtype=np.float64)
+        result = (raw - state.offset) * state.scale
+        for i in state.nonlinear_channels:
+            result[:, i] = state.models[i].apply(raw[:, i])
+        return result
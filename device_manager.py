@@ -0,0 +1,146 @@
+import heapq
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from operator import itemgetter
+
+from line_parser import ADC_NAMES
+from parameter_manager import ParameterManager
+from serial_manager import SerialManager
+
+ADC_CHANNELS = {name: i for i, name in enumerate(ADC_NAMES)}
+# A sample is complete when the last channel arrives
+LAST_CHANNEL = len(ADC_NAMES) - 1
+
+
+def device_label(port):
+    # /dev/ttyUSB0 -> ttyUSB0, COM3 -> COM3
+    return os.path.basename(port)
+
+
+def device_parameters_path(path, label):
+    """Per-device variant of a parameters file: parameters.json -> parameters_ttyUSB0.json."""
+    root, extension = os.path.splitext(path)
+    return f"{root}_{label}{extension}"
+
+
+class DeviceBatch:
+    """Everything one device delivered since the previous poll.
+
+    updates are all (timestamp, name, value) records, parameters only the non-ADC ones. timestamps and raw hold
+    the complete samples, res their calibrated values as an (n, channels) array (None without samples).
+    """
+
+    def __init__(self, device, updates, parameters, timestamps, raw, res):
+        self.device = device
+        self.updates = updates
+        self.parameters = parameters
+        self.timestamps = timestamps
+        self.raw = raw
+        self.res = res
+
+
+class Device:
+    """One board: its own parameter manager (or replay source) with reader thread, sample assembly and calibration."""
+
+    def __init__(self, parameter_manager, label, calibration, port=None):
+        self.parameter_manager = parameter_manager
+        self.label = label
+        self.calibration = calibration
+        self.port = port  # None lets the parameter manager look for a board itself
+        self.raw_sample = [None] * len(ADC_NAMES)  # Latest raw value per channel
+        self.timer = None  # Optional FrameTimer that gets the calibration time
+
+    @classmethod
+    def on_port(cls, port, calibration):
+        return cls(ParameterManager(SerialManager(port=port)), device_label(port), calibration, port)
+
+    def open(self, binary_mode=False):
+        self.parameter_manager.open_serial_connection(binary_mode=binary_mode, port=self.port)
+
+    def close(self):
+        self.parameter_manager.close_serial_connection()
+
+    def get_backlog(self):
+        return self.parameter_manager.get_backlog()
+
+    def poll(self):
+        updates = self.parameter_manager.check_parameter_updates()
+        parameters = []
+        timestamps = []
+        raw_batch = []
+        raw_sample = self.raw_sample
+        for record in updates:
+            channel = ADC_CHANNELS.get(record[1])
+            if channel is None:
+                parameters.append(record)
+                continue
+            raw_sample[channel] = record[2]
+            if channel == LAST_CHANNEL and None not in raw_sample:
+                # A complete sample: one value for every channel
+                timestamps.append(record[0])
+                raw_batch.append(tuple(raw_sample))
+        # Calibrate the whole batch at once
+        res = None
+        if raw_batch:
+            start = time.perf_counter()
+            res = self.calibration.apply(raw_batch)
+            if self.timer is not None:
+                self.timer.add("calibration", time.perf_counter() - start)
+        return DeviceBatch(self, updates, parameters, timestamps, raw_batch, res)
+
+
+class DeviceManager:
+    """Acquires from several boards at once.
+
+    Every Device has its own reader thread and calibration. poll() collects what each of them received, and
+    merge_updates() combines their records into one timestamp-ordered stream labeled by device.
+    For the UI it stands in for a single ParameterManager: commands go to every board, reads to the first one.
+    """
+
+    def __init__(self, devices):
+        self.devices = list(devices)
+        self.primary = self.devices[0]
+
+    def __len__(self):
+        return len(self.devices)
+
+    def open_serial_connection(self, binary_mode=False):
+        # Open the boards in parallel, each negotiation and startup read waits for its own device
+        with ThreadPoolExecutor(max_workers=len(self.devices)) as pool:
+            list(pool.map(lambda device: device.open(binary_mode), self.devices))
+
+    def close_serial_connection(self):
+        for device in self.devices:
+            device.close()
+
+    def get_serial_connection_name(self):
+        return ", ".join(device.parameter_manager.get_serial_connection_name() for device in self.devices)
+
+    def set_parameter(self, name, value):
+        for device in self.devices:
+            device.parameter_manager.set_parameter(name, value)
+
+    def get_parameter(self, name):
+        return self.primary.parameter_manager.get_parameter(name)
+
+    def get_parameters(self, names, timeout=None):
+        return self.primary.parameter_manager.get_parameters(names, timeout)
+
+    def get_cached(self, name, default=None):
+        return self.primary.parameter_manager.get_cached(name, default)
+
+    def get_backlog(self):
+        """Return the number of records received by all devices that poll() did not take yet."""
+        return sum(device.get_backlog() for device in self.devices)
+
+    def poll(self):
+        """Return one DeviceBatch per device, in device order."""
+        return [device.poll() for device in self.devices]
+
+    @staticmethod
+    def merge_updates(batches):
+        """Return the records of all batches as one timestamp-ordered list of (timestamp, label, name, value)."""
+        streams = [[(timestamp, batch.device.label, name, value) for timestamp, name, value in batch.updates]
+                   for batch in batches if batch.updates]
+        return list(heapq.merge(*streams, key=itemgetter(0)))
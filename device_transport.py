@@ -0,0 +1,125 @@
+import asyncio
+import threading
+from collections import defaultdict, deque
+
+# How long a request waits for its reply before giving up
+REPLY_TIMEOUT = 1.0
+
+
+def resolve(future, record):
+    # A request that timed out has already been cancelled
+    if not future.done():
+        future.set_result(record)
+
+
+class DeviceTransport:
+    """asyncio request/response layer on top of the SerialManager reader thread.
+
+    The event loop runs in its own thread. A request registers a future under the parameter name before the
+    command is written; the reader thread passes every parsed batch through route_replies(), which takes out the
+    records answering an outstanding request and resolves their futures. All other records stay in the
+    SerialManager sample queue, the stream of unsolicited updates. Every request has a timeout, so a reply the
+    device never sends cannot hang the caller.
+    """
+
+    def __init__(self, serial_manager, reply_timeout=REPLY_TIMEOUT):
+        self.serial_manager = serial_manager
+        self.reply_timeout = reply_timeout
+        self.loop = None
+        self.thread = None
+        self.waiting = defaultdict(deque)  # Parameter name -> futures of the requests waiting for it, oldest first
+        self.lock = threading.Lock()  # Guards waiting, which the reader thread and the loop both change
+        self.timeouts = 0
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="device-io", daemon=True)
+        self.thread.start()
+        self.serial_manager.reply_filter = self.route_replies
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.serial_manager.reply_filter = None
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=1)
+        self.loop.close()
+        self.loop = None
+        self.thread = None
+        with self.lock:
+            self.waiting.clear()
+
+    def is_running(self):
+        return self.thread is not None
+
+    def route_replies(self, records):
+        """Resolve the requests answered by records and return the unsolicited ones. Runs on the reader thread."""
+        if not self.waiting:
+            return records
+        unsolicited = []
+        with self.lock:
+            for record in records:
+                futures = self.waiting.get(record[1])
+                if futures:
+                    future = futures.popleft()
+                    if not futures:
+                        del self.waiting[record[1]]
+                    self.loop.call_soon_threadsafe(resolve, future, record)
+                else:
+                    unsolicited.append(record)
+        return unsolicited
+
+    def register(self, name):
+        # Must happen before the command is written, or a fast reply could pass unnoticed
+        future = self.loop.create_future()
+        with self.lock:
+            self.waiting[name].append(future)
+        return future
+
+    async def write(self, text):
+        await self.loop.run_in_executor(None, self.serial_manager.write_to_serial, text.encode())
+
+    async def wait(self, name, future, timeout=None):
+        try:
+            return await asyncio.wait_for(future, timeout or self.reply_timeout)
+        except asyncio.TimeoutError:
+            with self.lock:
+                futures = self.waiting.get(name)
+                if futures and future in futures:
+                    futures.remove(future)
+                    if not futures:
+                        del self.waiting[name]
+            self.timeouts += 1
+            return None
+
+    async def request(self, name, command=None, timeout=None):
+        """Send command (by default the bare name, which asks for the value) and return the reply.
+
+        The reply is the (timestamp, name, value) record of the first line for name that arrives after the
+        request was registered, or None after the timeout.
+        """
+        future = self.register(name)
+        await self.write(f"{name}\n" if command is None else command)
+        return await self.wait(name, future, timeout)
+
+    async def request_many(self, names, timeout=None):
+        """Ask for several values at once and return their replies in the order of names.
+
+        All requests go out back to back in a single write and the replies are collected as they arrive, so the
+        whole batch takes about one round trip instead of one per name.
+        """
+        futures = [self.register(name) for name in names]
+        await self.write("".join(f"{name}\n" for name in names))
+        return await asyncio.gather(*(self.wait(name, future, timeout) for name, future in zip(names, futures)))
+
+    def call(self, coroutine):
+        """Run a coroutine on the transport loop and wait for its result; not for use on the loop thread."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def get(self, name, command=None, timeout=None):
+        return self.call(self.request(name, command, timeout))
+
+    def get_many(self, names, timeout=None):
+        return self.call(self.request_many(names, timeout))
@@ -0,0 +1,183 @@
+"""Virtual ESP32 on a pseudo-terminal, for testing without a board (Linux/macOS only).
+
+    python esp32_simulator.py --rate 860 --noise 20 --corrupt 0.001
+    python main.py --port /dev/pts/5
+"""
+import argparse
+import math
+import os
+import random
+import select
+import threading
+import time
+import tty
+
+from line_parser import encode_frame
+
+# Startup values of the firmware settings
+DEFAULT_SETTINGS = {"meter": "0", "gain": "1", "rate": "4", "contacts": "0", "binary": "0"}
+# Bits per byte on a UART link with one start and one stop bit
+BITS_PER_BYTE = 10
+# Longest stretch the stream loop sleeps; samples that came due meanwhile are sent in one burst
+TICK = 0.002
+# Most link time that can be caught up in one burst after a stall
+MAX_BURST = 0.05
+# Samples per second the waveform is scaled to when streaming as fast as the link allows
+FULL_SPEED_WAVE_RATE = 1000.0
+
+
+class ESP32Simulator:
+    """Behaves like the firmware on the slave side of a pty.
+
+    Answers get ("gain") and set ("gain 3") commands for the settings in DEFAULT_SETTINGS with "name value", and
+    while meter is 1 streams adc0..adc3 at rate samples/s (0: as fast as the link allows) as text lines, or as binary frames after "binary 1" if
+    binary is enabled. baud limits the stream to what the serial link could carry. noise adds gaussian noise in
+    counts, gap_probability drops a sample now and then and corrupt_probability garbles one byte of a sample.
+    """
+
+    def __init__(self, rate=860.0, baud=115200, noise=0.0, gap_probability=0.0, corrupt_probability=0.0,
+                 binary=True, seed=None):
+        self.rate = rate
+        self.baud = baud
+        self.noise = noise
+        self.gap_probability = gap_probability
+        self.corrupt_probability = corrupt_probability
+        self.binary_supported = binary
+        self.random = random.Random(seed)
+        self.settings = dict(DEFAULT_SETTINGS)
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+        self.thread = None
+        self.running = False
+        self.sequence = 0  # Samples generated, also the binary frame sequence number
+        self.samples_sent = 0
+        self.bytes_sent = 0
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="esp32-simulator", daemon=True)
+        self.thread.start()
+        return self.port
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout=1)
+            self.thread = None
+
+    def close(self):
+        self.stop()
+        os.close(self.master)
+        os.close(self.slave)
+
+    def handle_command(self, line):
+        parts = line.split()
+        if not parts or parts[0] not in self.settings:
+            return b""
+        name = parts[0]
+        if name == "binary" and not self.binary_supported:
+            return b""  # Old firmware never answers
+        if len(parts) > 1:
+            self.settings[name] = parts[1]
+        return f"{name} {self.settings[name]}\n".encode()
+
+    def channel_values(self, k):
+        t = k / (self.rate or FULL_SPEED_WAVE_RATE)
+        values = []
+        for channel in range(4):
+            value = 8000 * math.sin(2 * math.pi * (0.5 + channel * 0.25) * t + channel) + 2000 * channel
+            if self.noise:
+                value += self.random.gauss(0.0, self.noise)
+            values.append(max(-32768, min(32767, int(value))))
+        return values
+
+    def encode_sample(self, values):
+        if self.settings["binary"] == "1":
+            data = encode_frame(self.sequence, values)
+        else:
+            data = "".join(f"adc{channel} {value}\n" for channel, value in enumerate(values)).encode()
+        if self.corrupt_probability and self.random.random() < self.corrupt_probability:
+            data = bytearray(data)
+            data[self.random.randrange(len(data))] = self.random.randrange(256)
+            data = bytes(data)
+        return data
+
+    def _run(self):
+        buffer = b""
+        started_at = time.monotonic()
+        sent_at_start = self.sequence
+        byte_budget = 0.0
+        last_time = started_at
+        while self.running:
+            readable, _, _ = select.select([self.master], [], [], TICK)
+            output = []
+            if readable:
+                try:
+                    buffer += os.read(self.master, 4096)
+                except OSError:
+                    break
+                while b"\n" in buffer:
+                    line, buffer = buffer.split(b"\n", 1)
+                    output.append(self.handle_command(line.decode(errors="replace")))
+            now = time.monotonic()
+            if self.settings["meter"] == "1":
+                # Samples due according to the rate, limited by the bytes the link could have carried
+                bytes_per_second = self.baud / BITS_PER_BYTE
+                byte_budget = min(byte_budget + (now - last_time) * bytes_per_second, bytes_per_second * MAX_BURST)
+                if self.rate:
+                    due = int((now - started_at) * self.rate) - (self.sequence - sent_at_start)
+                else:
+                    due = int(byte_budget)  # More than fit, the budget stops the loop
+                for _ in range(max(0, due)):
+                    values = self.channel_values(self.sequence)
+                    if self.gap_probability and self.random.random() < self.gap_probability:
+                        self.sequence += 1
+                        continue
+                    data = self.encode_sample(values)
+                    if len(data) > byte_budget:
+                        # Link saturated: like the firmware blocking on a full UART, sample slower from here on
+                        started_at = now
+                        sent_at_start = self.sequence
+                        break
+                    byte_budget -= len(data)
+                    output.append(data)
+                    self.sequence += 1
+                    self.samples_sent += 1
+            else:
+                started_at = now
+                sent_at_start = self.sequence
+            last_time = now
+            data = b"".join(output)
+            if data:
+                try:
+                    os.write(self.master, data)
+                except OSError:
+                    break
+                self.bytes_sent += len(data)
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Virtual ESP32 with ADS1115 on a pseudo-terminal")
+    parser.add_argument("--rate", type=float, default=860.0,
+                        help="Samples per second, 0 for as fast as the link allows (default 860)")
+    parser.add_argument("--baud", type=int, default=115200, help="Link speed that limits the stream (default 115200)")
+    parser.add_argument("--noise", type=float, default=0.0, help="Standard deviation of the noise in counts")
+    parser.add_argument("--gaps", type=float, default=0.0, help="Probability that a sample is left out")
+    parser.add_argument("--corrupt", type=float, default=0.0, help="Probability that a sample gets a garbled byte")
+    parser.add_argument("--no-binary", action="store_true", help="Behave like firmware without binary frames")
+    parser.add_argument("--seed", type=int, help="Random seed for reproducible noise, gaps and corruption")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    simulator = ESP32Simulator(args.rate, args.baud, args.noise, args.gaps, args.corrupt,
+                               binary=not args.no_binary, seed=args.seed)
+    print(f"Simulated ESP32 on {simulator.start()}")
+    try:
+        while True:
+            time.sleep(10)
+            print(f"{simulator.samples_sent} samples, {simulator.bytes_sent} bytes sent")
+    except KeyboardInterrupt:
+        simulator.close()
@@ -0,0 +1,68 @@
+import time
+
+import pygame
+
+# Frames per second drawn while samples are streaming
+DISPLAY_RATE = 60
+# Loop iterations per second while the meter is off and nothing arrives; input events wake the loop at once
+IDLE_RATE = 4
+# Records queued and not polled yet above which a frame is skipped so the ingest can catch up; about 0.3 s of
+# data from one board at 860 samples/s, or a replay running 16 times faster than real time
+BACKLOG_LIMIT = 1024
+# Never skip more frames than this in a row, the display has to stay alive
+MAX_SKIPPED_FRAMES = 5
+
+
+class FramePacer:
+    """Paces the main loop independently of the ingest, which runs on the serial reader threads.
+
+    should_render() allows at most fps frames per second and skips a frame now and then while the ingest falls
+    behind; after a skipped frame wait() returns at once so the loop polls again. Otherwise wait() sleeps until
+    the next frame is due, or much longer while idle, and returns early when an input event arrives, so the UI
+    stays responsive while the loop uses almost no CPU.
+    """
+
+    def __init__(self, fps=DISPLAY_RATE, idle_rate=IDLE_RATE, backlog_limit=BACKLOG_LIMIT,
+                 max_skipped_frames=MAX_SKIPPED_FRAMES):
+        self.frame_interval = 1.0 / fps
+        self.idle_interval = 1.0 / idle_rate
+        self.backlog_limit = backlog_limit
+        self.max_skipped_frames = max_skipped_frames
+        self.next_frame = time.perf_counter()
+        self.skipped_in_a_row = 0
+        self.skipped_frames = 0  # Total, for statistics
+        self.catching_up = False  # A due frame was just skipped, the next wait() returns at once
+
+    def should_render(self, backlog=0):
+        """Return True when a frame is due; backlog is the number of records received and not polled yet."""
+        now = time.perf_counter()
+        if now < self.next_frame:
+            return False
+        # A late frame moves the schedule instead of causing a burst of frames to catch up
+        self.next_frame = max(self.next_frame + self.frame_interval, now)
+        if backlog > self.backlog_limit and self.skipped_in_a_row < self.max_skipped_frames:
+            self.skipped_in_a_row += 1
+            self.skipped_frames += 1
+            self.catching_up = True
+            return False
+        self.skipped_in_a_row = 0
+        self.catching_up = False
+        return True
+
+    def wait(self, idle=False):
+        """Sleep until the next frame is due (idle: for 1 / idle_rate) or until an input event arrives.
+
+        Returns the event that ended the wait as a list, empty on a timeout. It was taken from the front of the
+        queue and has to be handled before the events pygame.event.get() returns, to keep them in order.
+        """
+        if self.catching_up:
+            # Only the first wait after a skipped frame: poll again at once, then sleep as usual
+            self.catching_up = False
+            return []
+        timeout = self.idle_interval if idle else self.next_frame - time.perf_counter()
+        if timeout <= 0:
+            return []
+        event = pygame.event.wait(max(1, int(timeout * 1000)))
+        if event.type == pygame.NOEVENT:
+            return []
+        return [event]
@@ -0,0 +1,63 @@
+import json
+import time
+
+import numpy as np
+
+from ring_buffer import RingBuffer
+
+# Timings kept per stage; older ones are overwritten
+FRAME_TIMING_WINDOW = 1000
+
+
+class FrameTimer:
+    """Rolling per-stage timings of the main loop.
+
+    Every stage keeps its last window durations in a RingBuffer, so memory stays fixed however long the program
+    runs. The main loop calls start_frame() once per iteration and lap(stage) after each stage, which records
+    the time since the previous lap; code that times a part of a stage itself (e.g. Scope.draw) uses add().
+    Percentiles are only computed when statistics() is called.
+    """
+
+    def __init__(self, window=FRAME_TIMING_WINDOW):
+        self.window = window
+        self.buffers = {}  # Stage -> RingBuffer of durations in seconds, in order of first use
+        self.frame_start = None
+        self.mark = None
+
+    def add(self, stage, seconds):
+        buffer = self.buffers.get(stage)
+        if buffer is None:
+            buffer = self.buffers[stage] = RingBuffer(self.window)
+        buffer.append(seconds)
+
+    def start_frame(self):
+        now = time.perf_counter()
+        if self.frame_start is not None:
+            self.add("frame", now - self.frame_start)
+        self.frame_start = now
+        self.mark = now
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        self.add(stage, now - self.mark)
+        self.mark = now
+
+    def statistics(self):
+        """Return {stage: (p50, p95, max)} in milliseconds."""
+        result = {}
+        for stage, buffer in self.buffers.items():
+            values = buffer.last()
+            if len(values):
+                p50, p95 = np.percentile(values, (50, 95))
+                result[stage] = (1000 * p50, 1000 * p95, 1000 * values.max())
+        return result
+
+    def dump(self, path):
+        """Write the statistics and every kept timing (ms, oldest first) per stage to a JSON file."""
+        statistics = self.statistics()
+        report = {stage: {"p50": statistics[stage][0], "p95": statistics[stage][1], "max": statistics[stage][2],
+                          "samples": (1000 * self.buffers[stage].last()).tolist()}
+                  for stage in statistics}
+        with open(path, 'w') as file:
+            json.dump(report, file, indent=4)
+        print(f"Frame timings written to {path}")
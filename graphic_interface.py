@@ -1,7 +1,54 @@
+import time
+import numpy as np
 import pygame
 from pygame.locals import *
-from colors import SCOPE_BG, BLACK, GREEN
-from collections import deque  # for ScopeSignal class
+from collections import OrderedDict, deque  # for TextRenderCache and TerminalWindow classes
+from itertools import islice
+from colors import SCOPE_BG, BLACK, GREEN, GRAY
+from history_pyramid import HistoryPyramid, NR_OF_LEVELS  # for ScopeSignal class
+
+# Number of rendered text surfaces kept by the shared text cache
+TEXT_CACHE_SIZE = 2048
+# Lines of history a TerminalWindow keeps for scrolling back, and lines per mouse wheel notch
+TERMINAL_SCROLLBACK = 10000
+TERMINAL_SCROLL_STEP = 3
+# Scope zoom range: 2**-3 samples per pixel up to the coarsest level of the history pyramid
+MIN_TIME_SCALE = -3
+MAX_TIME_SCALE = NR_OF_LEVELS - 1
+# Cell size in pixels of the EventRouter's hit-test grid
+ROUTER_CELL_SIZE = 64
+# Group of the DirtyRenderer scene that widgets added without one go to
+DEFAULT_GROUP = "default"
+
+
+class TextRenderCache:
+    """LRU cache of rendered text surfaces, shared by all widgets and keyed by (font, text, color)."""
+
+    def __init__(self, max_entries=TEXT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, font, text, color, antialias=True):
+        key = (font, text, tuple(color), antialias)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            self.hits += 1
+            return surface
+        self.misses += 1
+        surface = font.render(text, antialias, color)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.max_entries:
+            self.surfaces.popitem(last=False)  # Drop the least recently used surface
+        return surface
+
+    def clear(self):
+        self.surfaces.clear()
+
+
+text_cache = TextRenderCache()
 
 
 class Slider:
@@ -23,6 +70,11 @@ class Slider:
             (self.value - self.min_value) / (self.max_value - self.min_value) * (self.width - 20)) + self.x
         self.slot_color = slot_color
         self.slider_color = slider_color
+        self.dirty = True  # Needs to be redrawn
+        self.focusable = True  # Takes the arrow keys after a click
+
+    def get_rect(self):
+        return pygame.Rect(self.x, self.y, self.width, self.height)
 
     def draw(self, screen):
         # Draw slider track
@@ -56,11 +108,10 @@ class Slider:
 
     def handle_event(self, event):
         if event.type == MOUSEBUTTONDOWN:
-            mouse_pos = pygame.mouse.get_pos()
             slider_rect = pygame.Rect(self.slider_pos, self.y, 20, self.height)
-            if slider_rect.collidepoint(mouse_pos):
+            if slider_rect.collidepoint(event.pos):
                 self.dragging = True
-                self.prev_mouse_x = mouse_pos[0]  # Store previous mouse x position
+                self.prev_mouse_x = event.pos[0]  # Store previous mouse x position
         elif event.type == MOUSEBUTTONUP:
             self.dragging = False
         elif event.type == MOUSEMOTION:
@@ -72,6 +123,7 @@ class Slider:
                 # Calculate new slider position
                 self.slider_pos += delta_x
                 self.slider_pos = max(self.x, min(self.x + self.width - 20, self.slider_pos))
+                self.dirty = True
 
                 # Calculate new value based on slider position
                 new_value = ((self.slider_pos - self.x) / (self.width - 20)) * (self.max_value - self.min_value) + self.min_value
@@ -81,12 +133,12 @@ class Slider:
                 quantized_value = round(self.value / self.step_size) * self.step_size
                 self.update_value(quantized_value)
                 self.update_slider_position()
-        elif event.type == KEYDOWN and pygame.key.get_focused():
-            if self.is_mouse_over():
-                if event.key == K_LEFT:
-                    self.decrease_value()
-                elif event.key == K_RIGHT:
-                    self.increase_value()
+        elif event.type == KEYDOWN:
+            # Only delivered while the slider has the keyboard focus or the mouse is over it, see EventRouter
+            if event.key == K_LEFT:
+                self.decrease_value()
+            elif event.key == K_RIGHT:
+                self.increase_value()
 
     def is_mouse_over(self):
         # Check if the mouse is over the slider
@@ -120,9 +172,11 @@ class Slider:
         # Update the slider position based on the current value
         self.slider_pos = int(
             (self.value - self.min_value) / (self.max_value - self.min_value) * (self.width - 20)) + self.x
+        self.dirty = True
 
 class PushButtonPic:
-    def __init__(self, x, y, on_image, off_image, text, font=None, font_size=20, font_color=BLACK,callback=None):
+    def __init__(self, x, y, on_image, off_image, text, font=None, font_size=20, font_color=BLACK,callback=None,
+                 momentary=False):
         self.x = x
         self.y = y
         self.on_image = pygame.image.load(on_image)
@@ -135,24 +189,39 @@ class PushButtonPic:
         self.font_color = font_color
         self.state = False
         self.callback = callback
+        self.momentary = momentary  # Acts on every click instead of toggling
+        self.dirty = True  # Needs to be redrawn
+        # The caption never changes, so it is rendered once
+        self.text_surface = text_cache.render(self.font, self.text, self.font_color)
+        self.text_rect = self.text_surface.get_rect(center=(self.x + self.image.get_width() / 2, self.y +
+                                                            (self.image.get_height() - self.font.get_height() / 2) / 2))
+
+    def get_rect(self):
+        return self.rect.union(self.text_rect)
 
     def draw(self, screen):
         screen.blit(self.image, self.rect)
-        # Render and draw text on button
-        text_surface = self.font.render(self.text, True, self.font_color)
-        text_rect = text_surface.get_rect(center=(self.x + self.image.get_width() / 2, self.y +
-                                                  (self.image.get_height() - self.font.get_height() / 2) / 2))
-        screen.blit(text_surface, text_rect)
+        # Draw text on button
+        screen.blit(self.text_surface, self.text_rect)
+
+    def blit_items(self):
+        # The same as draw(), for DirtyRenderer to batch into one Surface.blits() call
+        return [(self.image, self.rect), (self.text_surface, self.text_rect)]
 
     def handle_event(self, event):
         if event.type == pygame.MOUSEBUTTONDOWN:
-            mouse_pos = pygame.mouse.get_pos()
-            if self.rect.collidepoint(mouse_pos):
+            if self.rect.collidepoint(event.pos):
+                if self.momentary:
+                    self.dirty = True
+                    if self.callback:
+                        self.callback(True)
+                    return
                 self.state = not self.state
                 if self.state:
                     self.image = self.on_image
                 else:
                     self.image = self.off_image
+                self.dirty = True
                 if self.callback:
                     self.callback(self.state)
 
@@ -162,8 +231,11 @@ class PushButtonPic:
             self.image = self.on_image
         else:
             self.image = self.off_image
+        self.dirty = True
 
     def set_state(self, state):
+        if state != self.state:
+            self.dirty = True
         self.state = state
         if self.state:
             self.image = self.on_image
@@ -186,6 +258,11 @@ class PushButton:
         self.font = pygame.font.SysFont(font, font_size) if font else pygame.font.Font(None, font_size)
         self.state = False  # Initial state
         self.callback = callback
+        self.dirty = True  # Needs to be redrawn
+        self.text_surface = text_cache.render(self.font, self.text, (0, 0, 0))
+
+    def get_rect(self):
+        return pygame.Rect(self.x, self.y, self.width, self.height)
 
     def draw(self, screen):
         # Draw button outline
@@ -195,10 +272,9 @@ class PushButton:
         color = self.on_color if self.state else self.off_color
         pygame.draw.rect(screen, color, (self.x + 2, self.y + 2, self.width - 4, self.height - 4))
 
-        # Render and draw text on button
-        text_surface = self.font.render(self.text, True, (0, 0, 0))
-        text_rect = text_surface.get_rect(center=(self.x + self.width / 2, self.y + self.height / 2))
-        screen.blit(text_surface, text_rect)
+        # Draw text on button
+        text_rect = self.text_surface.get_rect(center=(self.x + self.width / 2, self.y + self.height / 2))
+        screen.blit(self.text_surface, text_rect)
 
     def update(self):
         # Implement button update logic here
@@ -206,16 +282,20 @@ class PushButton:
 
     def handle_event(self, event):
         if event.type == MOUSEBUTTONDOWN:
-            mouse_pos = pygame.mouse.get_pos()
+            mouse_pos = event.pos
             if self.x < mouse_pos[0] < self.x + self.width and self.y < mouse_pos[1] < self.y + self.height:
                 self.state = not self.state
+                self.dirty = True
                 if self.callback:
                     self.callback(self.state)
 
     def toggle(self):
         self.state = not self.state
+        self.dirty = True
 
     def set(self, state):
+        if state != self.state:
+            self.dirty = True
         self.state = state
 
     def get(self):
@@ -249,6 +329,15 @@ class TextField:
         self.passive_text_color = passive_text_color
         self.background_color = background_color
         self.callback = callback
+        self.dirty = True  # Needs to be redrawn
+        self.text_surface = None  # Rendered text, reset whenever the text or its color changes
+
+    def get_rect(self):
+        return pygame.Rect(self.x, self.y, self.width, self.height)
+
+    def mark_dirty(self):
+        self.dirty = True
+        self.text_surface = None
 
     def draw(self, screen):
         # Draw the text field rectangle
@@ -256,25 +345,29 @@ class TextField:
         pygame.draw.rect(screen, self.rect_color, (self.x, self.y, self.width, self.height), 2)
 
         # Render the text
-        if self.active:
-            color = self.active_text_color
-        else:
-            color = self.passive_text_color
-        # text_surface = self.font.render(self.text, True, color)
-        custom_font = self.font
-        text_surface = custom_font.render(self.text, True, color)
+        if self.text_surface is None:
+            if self.active:
+                color = self.active_text_color
+            else:
+                color = self.passive_text_color
+            self.text_surface = text_cache.render(self.font, self.text, color)
 
-        text_rect = text_surface.get_rect(center=(self.x + self.width / 2, self.y + self.height / 2))
-        screen.blit(text_surface, text_rect)
+        text_rect = self.text_surface.get_rect(center=(self.x + self.width / 2, self.y + self.height / 2))
+        # Text wider than the field is cut off at its border, outside get_rect() it would never be repaired
+        field_rect = self.get_rect()
+        area = text_rect.clip(field_rect).move(-text_rect.x, -text_rect.y)
+        screen.blit(self.text_surface, text_rect.clip(field_rect), area)
 
     def handle_event(self, event):
         if event.type == MOUSEBUTTONDOWN:
-            if self.is_mouse_over(pygame.mouse.get_pos()):
-                self.active = True
-            else:
-                self.active = False
+            # Also delivered on a click elsewhere while this field has the focus, so it can deactivate
+            active = self.is_mouse_over(event.pos)
+            if active != self.active:
+                self.active = active
+                self.mark_dirty()
         elif event.type == KEYDOWN:
             if self.active:
+                self.mark_dirty()
                 if event.key == K_BACKSPACE:
                     self.text = self.text[:-1]
                 elif event.key == K_RETURN:
@@ -306,6 +399,7 @@ class TextField:
             self.passive_text_color = passive_text_color
         if background_color:
             self.background_color = background_color
+        self.mark_dirty()
 
     def update(self):
         pass
@@ -318,38 +412,94 @@ class TextField:
 
     def set_value(self, value):
         self.value = value
-        self.text = str(value)
+        text = str(value)
+        if text != self.text:
+            self.text = text
+            self.mark_dirty()
 
     def is_editable(self):
         return self.editable
 
+    @property
+    def focusable(self):
+        return self.editable
+
     def set_editable(self, editable):
         self.editable = editable
 
 
 class TerminalWindow:
-    def __init__(self, x, y, width, height, background_color=pygame.Color('white')):
+    def __init__(self, x, y, width, height, background_color=pygame.Color('white'), scrollback_size=TERMINAL_SCROLLBACK):
         self.x = x
         self.y = y
         self.width = width
         self.height = height
         self.background_color = background_color
-        self.text_lines = []  # Buffer for terminal text
         self.font = pygame.font.SysFont('Consolas', 20)  # You can adjust the font size as needed
+        self.line_height = self.font.get_height() + 5  # Adjust the spacing between lines
+        self.visible_lines = max(1, (self.height - 5) // self.line_height)  # Lines that fit inside the window
+        # Newest lines, rendered once when they arrive
+        self.rendered_lines = deque(maxlen=self.visible_lines)
+        # Much longer history as plain (text, color) tuples, only rendered when scrolled into view
+        self.scrollback = deque(maxlen=scrollback_size)
+        self.scroll_offset = 0  # Number of lines scrolled back from the newest line
+        self.dirty = True  # Needs to be redrawn
+
+    def get_rect(self):
+        return pygame.Rect(self.x, self.y, self.width, self.height)
 
     def draw(self, screen):
         pygame.draw.rect(screen, self.background_color, (self.x, self.y, self.width, self.height))
-        y_offset = self.y
-        for line in self.text_lines:
-            text_surface = self.font.render(line['text'], True, line['color'])
-            screen.blit(text_surface, (self.x + 5, y_offset + 5))  # Adjust the padding as needed
-            y_offset += text_surface.get_height() + 5  # Adjust the spacing between lines
+        if self.scroll_offset == 0:
+            surfaces = self.rendered_lines
+        else:
+            end = len(self.scrollback) - self.scroll_offset
+            start = max(0, end - self.visible_lines)
+            surfaces = [text_cache.render(self.font, text, color)
+                        for text, color in islice(self.scrollback, start, end)]
+        # Adjust the padding as needed
+        screen.blits([(surface, (self.x + 5, self.y + 5 + i * self.line_height))
+                      for i, surface in enumerate(surfaces)], False)
+        if self.scroll_offset:
+            self.draw_scrollbar(screen)
+
+    def draw_scrollbar(self, screen):
+        total = len(self.scrollback)
+        bar_height = max(10, self.height * self.visible_lines // total)
+        bar_y = self.y + (self.height - bar_height) * (total - self.visible_lines - self.scroll_offset) // max(
+            1, total - self.visible_lines)
+        pygame.draw.rect(screen, GRAY, (self.x + self.width - 6, bar_y, 4, bar_height))
+
+    def handle_event(self, event):
+        # Wheel events arrive only while the mouse is over the window, see EventRouter
+        if event.type == MOUSEWHEEL:
+            self.scroll(event.y * TERMINAL_SCROLL_STEP)
+
+    def scroll(self, lines):
+        max_offset = max(0, len(self.scrollback) - self.visible_lines)
+        scroll_offset = max(0, min(max_offset, self.scroll_offset + lines))
+        if scroll_offset != self.scroll_offset:
+            self.scroll_offset = scroll_offset
+            self.dirty = True
 
     def add_message(self, message, color=pygame.Color('black')):
-        self.text_lines.append({'text': message, 'color': color})
-        # Trim excess lines if necessary to fit within the window
-        while len(self.text_lines) * (self.font.get_height() + 5) > self.height:
-            self.text_lines.pop(0)
+        self.scrollback.append((message, tuple(color)))
+        self.rendered_lines.append(self.font.render(message, True, color))
+        self.after_add(1)
+
+    def add_messages(self, messages, color=pygame.Color('black')):
+        # Burst of lines: all of them go to the scrollback, only the ones that stay visible are rendered
+        color = tuple(color)
+        self.scrollback.extend((message, color) for message in messages)
+        for message in messages[-self.visible_lines:]:
+            self.rendered_lines.append(self.font.render(message, True, color))
+        self.after_add(len(messages))
+
+    def after_add(self, nr_of_lines):
+        if self.scroll_offset:
+            # Keep the lines the user scrolled to in view
+            self.scroll_offset = min(self.scroll_offset + nr_of_lines, max(0, len(self.scrollback) - self.visible_lines))
+        self.dirty = True
 
 
 class Label:
@@ -365,15 +515,25 @@ class Label:
         else:
             self.font = pygame.font.SysFont(font, font_size)
 
-        self.rendered_text = self.font.render(text, True, color)
+        self.rendered_text = text_cache.render(self.font, text, color)
+        self.dirty = True  # Needs to be redrawn
+
+    def get_rect(self):
+        return self.rendered_text.get_rect(topleft=(self.x, self.y))
 
     def set_text(self, text):
+        if text == self.text:
+            return
         self.text = text
-        self.rendered_text = self.font.render(text, True, self.color)
+        self.rendered_text = text_cache.render(self.font, text, self.color)
+        self.dirty = True
 
     def draw(self, screen):
         screen.blit(self.rendered_text, (self.x, self.y))
 
+    def blit_items(self):
+        return [(self.rendered_text, (self.x, self.y))]
+
 
 class Scope:
     def __init__(self, x, y, width, height, bg_color=SCOPE_BG, dev_per_quad_x=5, dev_per_quad_y=4):
@@ -385,95 +545,183 @@ class Scope:
         self.dev_per_quad_x = dev_per_quad_x
         self.dev_per_quad_y = dev_per_quad_y
         self.time_scale = 0
+        self.pan_end = None  # Sample index at the right edge while panned back, None follows the newest samples
+        self.drag_x = None
         self.delta_t = None
         self.signals = []
+        self.raster_color = BLACK
+        # Background and graticule are rendered off-screen once and rebuilt only when their settings change
+        self.background_surface = None
+        self.graticule_surface = None
+        self.surfaces_key = None
+        self.dirty = True  # Needs to be redrawn
+        self.timer = None  # Optional FrameTimer that gets the time spent on the traces
+
+    def get_rect(self):
+        return pygame.Rect(self.x, self.y, self.width, self.height)
 
     def update(self, screen):
         self.draw(screen)
 
     def set_time_scale(self, time_scale):
-        self.time_scale = time_scale
+        self.time_scale = max(MIN_TIME_SCALE, min(MAX_TIME_SCALE, time_scale))
+        self.dirty = True
+
+    def zoom(self, steps):
+        # Positive steps zoom out, doubling the time per division per step; the right edge stays where it is
+        self.set_time_scale(self.time_scale + steps)
+
+    def pan(self, pixels):
+        # Positive pixels move the view back in time
+        newest = max((signal.total() for signal in self.signals), default=0)
+        end = newest if self.pan_end is None else self.pan_end
+        end -= round(pixels * 2.0 ** self.time_scale)
+        self.pan_end = None if end >= newest else max(0, end)
+        self.dirty = True
+
+    def follow(self):
+        self.pan_end = None
+        self.dirty = True
+
+    def is_following(self):
+        return self.pan_end is None
+
+    def handle_event(self, event):
+        # Mouse wheel zooms, dragging pans through the history and the right button returns to the newest samples
+        if event.type == pygame.MOUSEWHEEL:
+            self.zoom(-event.y)
+        elif event.type == pygame.MOUSEBUTTONDOWN and self.get_rect().collidepoint(event.pos):
+            if event.button == 1:
+                self.drag_x = event.pos[0]
+            elif event.button == 3:
+                self.follow()
+        elif event.type == pygame.MOUSEBUTTONUP and event.button == 1:
+            self.drag_x = None
+        elif event.type == pygame.MOUSEMOTION and self.drag_x is not None:
+            self.pan(event.pos[0] - self.drag_x)
+            self.drag_x = event.pos[0]
+
+    def set_divisions(self, dev_per_quad_x, dev_per_quad_y):
+        self.dev_per_quad_x = dev_per_quad_x
+        self.dev_per_quad_y = dev_per_quad_y
+        self.dirty = True
+
+    def build_surfaces(self):
+        self.background_surface = pygame.Surface((self.width, self.height))
+        self.background_surface.fill(self.bg_color)
+        # Transparent overlay so the raster stays on top of the traces
+        self.graticule_surface = pygame.Surface((self.width, self.height), pygame.SRCALPHA)
+        self.graticule_surface.fill((0, 0, 0, 0))
+        self.draw_raster(self.graticule_surface, self.raster_color, origin=(0, 0))
 
     def draw(self, screen):
+        surfaces_key = (self.width, self.height, self.bg_color, self.raster_color,
+                        self.dev_per_quad_x, self.dev_per_quad_y)
+        if surfaces_key != self.surfaces_key:
+            self.build_surfaces()
+            self.surfaces_key = surfaces_key
+
+        # Keep the thick trace lines inside the scope rectangle
+        previous_clip = screen.get_clip()
+        screen.set_clip(self.get_rect().clip(previous_clip))
+
         # draw background
-        pygame.draw.rect(screen, self.bg_color, (self.x, self.y, self.width, self.height))
+        screen.blit(self.background_surface, (self.x, self.y))
 
         # draw signal(s)
-        self.draw_signals(screen)
+        if self.timer is None:
+            self.draw_signals(screen)
+        else:
+            start = time.perf_counter()
+            self.draw_signals(screen)
+            self.timer.add("scope_signals", time.perf_counter() - start)
 
         # draw raster
-        self.draw_raster(screen)
+        screen.blit(self.graticule_surface, (self.x, self.y))
+        screen.set_clip(previous_clip)
 
-    def draw_raster(self, screen, raster_color=BLACK):
+    def draw_raster(self, screen, raster_color=BLACK, origin=None):
+        x, y = (self.x, self.y) if origin is None else origin
         # draw center lines
-        pygame.draw.line(screen, raster_color, (self.width / 2 + self.x, self.y),
-                         (self.width / 2 + self.x, self.y + self.height), 2)
-        pygame.draw.line(screen, raster_color, (self.x, self.height / 2 + self.y),
-                         (self.x + self.width, self.height / 2 + self.y), 2)
+        pygame.draw.line(screen, raster_color, (self.width / 2 + x, y),
+                         (self.width / 2 + x, y + self.height), 2)
+        pygame.draw.line(screen, raster_color, (x, self.height / 2 + y),
+                         (x + self.width, self.height / 2 + y), 2)
 
-        y_start = (self.width / 2 + self.x - 3, self.width / 2 + self.x + 4,
+        y_start = (self.width / 2 + x - 3, self.width / 2 + x + 4,
                    self.height / (5 * (2 * self.dev_per_quad_y)), self.height / (2 * self.dev_per_quad_y))
-        x_start = (self.height / 2 + self.y - 3, self.height / 2 + self.y + 4,
+        x_start = (self.height / 2 + y - 3, self.height / 2 + y + 4,
                    self.width / (5 * (2 * self.dev_per_quad_x)), self.width / (2 * self.dev_per_quad_x))
 
         for i in range(5 * (2 * self.dev_per_quad_y)):
-            pygame.draw.line(screen, raster_color, (y_start[0], self.y + y_start[2] * i),
-                             (y_start[1], self.y + y_start[2] * i), 1)
+            pygame.draw.line(screen, raster_color, (y_start[0], y + y_start[2] * i),
+                             (y_start[1], y + y_start[2] * i), 1)
 
         for i in range(5 * (2 * self.dev_per_quad_x)):
-            pygame.draw.line(screen, raster_color, (self.x + x_start[2] * i, x_start[0]),
-                             (self.x + x_start[2] * i, x_start[1]), 1)
+            pygame.draw.line(screen, raster_color, (x + x_start[2] * i, x_start[0]),
+                             (x + x_start[2] * i, x_start[1]), 1)
 
         for i in range(2 * self.dev_per_quad_y):
-            pygame.draw.line(screen, raster_color, (self.x, self.y + y_start[3] * i),
-                             (self.x + self.width, self.y + y_start[3] * i), 1)
+            pygame.draw.line(screen, raster_color, (x, y + y_start[3] * i),
+                             (x + self.width, y + y_start[3] * i), 1)
         for i in range(2 * self.dev_per_quad_x):
-            pygame.draw.line(screen, raster_color, (self.x + x_start[3] * i, self.y),
-                             (self.x + x_start[3] * i, self.y + self.height), 1)
+            pygame.draw.line(screen, raster_color, (x + x_start[3] * i, y),
+                             (x + x_start[3] * i, y + self.height), 1)
 
     def y_val_2_pixel(self, signal, y):
         return round(-y / signal.val_per_division * self.height / (2 * self.dev_per_quad_y) - signal.offset *
                      self.height / (2 * self.dev_per_quad_y) + self.y + self.height / 2)
 
+    def values_to_pixels(self, signal, values):
+        # Vectorized y_val_2_pixel for a whole array of values
+        pixels_per_division = self.height / (2 * self.dev_per_quad_y)
+        return (self.y + self.height / 2) - (values / signal.val_per_division + signal.offset) * pixels_per_division
+
     def draw_signals(self, screen):
-        for idx, signal in enumerate(self.signals):
-            if self.time_scale > 0:
-                min_nr = 2 * 2 ** self.time_scale
-            else:
-                min_nr = 2
-            if len(signal.values) >= min_nr:
-                # Draw lines between data points
-                if self.time_scale == 0:
-                    nr_of_steps = min(self.width, len(signal.values))
-                    iterator_scale = 1
-                    zoom_scale = 1
-                elif self.time_scale > 0:
-                    nr_of_steps = min(self.width, len(signal.values)) // 2 ** self.time_scale
-                    iterator_scale = 2 ** self.time_scale
-                    zoom_scale = 1
-                else:  # self.time_scale < 0
-                    nr_of_steps = min(self.width // 2 ** -self.time_scale, len(signal.values))
-                    iterator_scale = 1
-                    zoom_scale = 2 ** -self.time_scale
-
-                for j in range(1, nr_of_steps):  #
-                    i = j * iterator_scale
-                    y0 = self.y_val_2_pixel(signal, float(signal.values[-i]))
-                    y1 = self.y_val_2_pixel(signal, float(signal.values[-(i + 1)]))
-                    start_point = (self.x + self.width - i * zoom_scale, int(y0))
-                    end_point = (self.x + self.width - i * zoom_scale - 1, int(y1))
-                    if not (start_point[1] < self.y or start_point[1] > (self.y + self.height) and
-                            end_point[1] < self.y or end_point[1] > (self.y + self.height)):
-                        if start_point[1] < self.y:
-                            start_point = (start_point[0], self.y)
-                        if start_point[1] > (self.y + self.height):
-                            start_point = (start_point[0], self.y + self.height)
-                        if end_point[1] < self.y:
-                            end_point = (end_point[0], self.y)
-                        if end_point[1] > (self.y + self.height):
-                            end_point = (end_point[0], self.y + self.height)
-
-                        pygame.draw.line(screen, signal.color, start_point, end_point, 4)
+        # time_scale > 0 compresses 2**time_scale samples into one pixel column,
+        # time_scale < 0 stretches one sample over 2**-time_scale pixels.
+        # Level time_scale of the history pyramid has exactly one min/max entry per column, so drawing costs
+        # O(width) at every zoom level.
+        if self.time_scale >= 0:
+            level = self.time_scale
+            pixels_per_step = 1
+        else:
+            level = 0
+            pixels_per_step = 2 ** -self.time_scale
+        nr_of_steps = self.width // pixels_per_step
+        right = self.x + self.width - 1
+        x_steps = np.arange(nr_of_steps) * -pixels_per_step + right
+        end = None if self.pan_end is None else self.pan_end >> level
+
+        for signal in self.signals:
+            mins, maxs, means = signal.history.window(level, nr_of_steps, end)
+            if level > 0:
+                self.draw_envelope(screen, signal, mins, maxs, means, x_steps)
+                continue
+            # Newest sample first, one value per step
+            values = mins[::-1]
+            y_pixels = np.clip(self.values_to_pixels(signal, values), self.y, self.y + self.height)
+            points = np.column_stack((x_steps[:len(values)], y_pixels))
+            if len(points) < 2:
+                continue
+            pygame.draw.lines(screen, signal.color, False, points.tolist(), 4)
+
+    def draw_envelope(self, screen, signal, mins, maxs, means, x_steps):
+        # Min/max envelope: every pixel column gets a filled 1 px wide span from the lowest to the highest of its
+        # samples, so spikes that fall between the columns still show up. The span also reaches the mean of the
+        # previous column, so steep slopes stay one continuous trace, and is widened by 2 px on both sides so a
+        # flat trace stays about as thick as the 4 px line.
+        nr_of_columns = len(mins)
+        if nr_of_columns > 1:
+            mins = np.concatenate((mins[:1], np.minimum(mins[1:], means[:-1])))
+            maxs = np.concatenate((maxs[:1], np.maximum(maxs[1:], means[:-1])))
+        # Newest column first, like x_steps
+        tops = np.clip(self.values_to_pixels(signal, maxs[::-1]) - 2, self.y, self.y + self.height).astype(int)
+        bottoms = np.clip(self.values_to_pixels(signal, mins[::-1]) + 2, self.y, self.y + self.height).astype(int)
+        fill = screen.fill
+        color = signal.color
+        for x, top, height in zip(x_steps[:nr_of_columns].tolist(), tops.tolist(), (bottoms - tops + 1).tolist()):
+            fill(color, (x, top, 1, height))
 
     def add_signal(self, offset, val_per_division=100, color=GREEN):
         new_signal = ScopeSignal(offset, val_per_division, color, max_length=self.width * 4)
@@ -482,6 +730,14 @@ class Scope:
     def add_data_to_signal(self, signal_index, value):
         if signal_index < len(self.signals):
             self.signals[signal_index].add_value(value)
+            self.dirty = True
+        else:
+            print("Invalid signal index")
+
+    def add_values_to_signal(self, signal_index, values):
+        if signal_index < len(self.signals):
+            self.signals[signal_index].add_values(values)
+            self.dirty = True
         else:
             print("Invalid signal index")
 
@@ -491,11 +747,293 @@ class ScopeSignal:
         self.offset = offset
         self.val_per_division = val_per_division
         self.color = color
-        self.values = deque(maxlen=max_length)  # Use deque with a fixed maximum length
+        # max_length entries per resolution level; the raw samples are level 0
+        self.history = HistoryPyramid(max_length)
+        self.values = self.history.raw
         self.active = True
 
     def add_value(self, value):
-        self.values.append(value)
+        self.history.append(value)
+
+    def add_values(self, values):
+        self.history.extend(values)
+
+    def last(self, n=None):
+        return self.values.last(n)
+
+    def total(self):
+        # Number of samples ever added, the index of the next sample
+        return self.history.counts[0]
+
+
+class TimingOverlay:
+    """Semi-transparent panel with lines of text, e.g. frame timing statistics; hidden until toggled."""
+
+    def __init__(self, x, y, width, height, font_size=20, color=(255, 255, 255), background_color=(0, 0, 0, 160)):
+        self.rect = pygame.Rect(x, y, width, height)
+        # Monospaced so the columns line up
+        self.font = pygame.font.SysFont("consolas,dejavusansmono,couriernew,monospace", font_size)
+        self.color = color
+        self.line_height = self.font.get_height() + 2
+        self.background = pygame.Surface(self.rect.size, pygame.SRCALPHA)
+        self.background.fill(background_color)
+        self.lines = []
+        self.visible = False
+        self.dirty = True  # Needs to be redrawn
+
+    def get_rect(self):
+        return self.rect
+
+    def toggle(self):
+        self.visible = not self.visible
+        self.dirty = True
+
+    def set_lines(self, lines):
+        if lines != self.lines:
+            self.lines = lines
+            self.dirty = self.dirty or self.visible
+
+    def draw(self, screen):
+        if not self.visible:
+            return
+        screen.blit(self.background, self.rect)
+        screen.blits([(text_cache.render(self.font, line, self.color),
+                       (self.rect.x + 5, self.rect.y + 5 + i * self.line_height))
+                      for i, line in enumerate(self.lines)], False)
+
+
+class StaticLayer:
+    """The static widgets of a SceneGroup, composed once into a surface that is blitted as a whole."""
+
+    def __init__(self, background_color):
+        self.background_color = background_color
+        self.widgets = []
+        self.surface = None
+        self.position = (0, 0)
+
+    @property
+    def dirty(self):
+        return self.surface is None or any(widget.dirty for widget in self.widgets)
+
+    @dirty.setter
+    def dirty(self, dirty):
+        if dirty:
+            self.surface = None
+
+    def get_rect(self):
+        rects = [widget.get_rect() for widget in self.widgets]
+        return rects[0].unionall(rects[1:])
+
+    def compose(self, scratch):
+        # The widgets draw themselves at their screen position on the scratch surface and the covered part is
+        # copied; pixels left at the background colour stay transparent through the colour key
+        rect = self.get_rect().clip(scratch.get_rect())
+        scratch.fill(self.background_color, rect)
+        for widget in self.widgets:
+            widget.draw(scratch)
+            widget.dirty = False
+        self.surface = scratch.subsurface(rect).copy()
+        self.surface.set_colorkey(self.background_color)
+        self.position = rect.topleft
+
+    def blit_items(self):
+        return [(self.surface, self.position)]
+
+    def draw(self, screen):
+        screen.blit(self.surface, self.position)
+
+
+class SceneGroup:
+    """The widgets of one panel: the static layer first, then the others."""
+
+    def __init__(self, name, z, background_color):
+        self.name = name
+        self.z = z
+        self.layer = StaticLayer(background_color)
+        self.widgets = []
+
+    def add(self, *widgets, static=False):
+        if static:
+            self.layer.widgets.extend(widgets)
+        else:
+            self.widgets.extend(widgets)
+
+    def get_items(self):
+        return ([self.layer] if self.layer.widgets else []) + self.widgets
+
+
+class DirtyRenderer:
+    """Redraws only the widgets that changed, group by group in z-order, batching plain surfaces into blits()."""
+
+    def __init__(self, background_color):
+        self.background_color = background_color
+        self.groups = {}
+        self.items = None  # Drawing order of all groups, rebuilt when widgets are added
+        self.drawn_rects = {}  # Rect each item covered when it was last drawn
+        self.scratch = None  # Screen-sized surface the static layers are composed on
+        self.full_redraw = True
+
+    def add_group(self, name, z=0):
+        # Groups are drawn by z, groups with the same z in the order they were created
+        group = self.groups.get(name)
+        if group is None:
+            group = self.groups[name] = SceneGroup(name, z, self.background_color)
+        group.z = z
+        self.items = None
+        self.full_redraw = True
+        return group
+
+    def add(self, *widgets, group=DEFAULT_GROUP, static=False):
+        scene_group = self.groups.get(group) or self.add_group(group)
+        scene_group.add(*widgets, static=static)
+        self.items = None
+        self.full_redraw = True
+
+    def get_items(self):
+        if self.items is None:
+            groups = sorted(self.groups.values(), key=lambda group: group.z)  # Stable: same z keeps creation order
+            self.items = [item for group in groups for item in group.get_items()]
+        return self.items
+
+    def invalidate(self):
+        # Repaint everything on the next draw, e.g. after the window was resized or exposed
+        self.full_redraw = True
+
+    def compose_layers(self, screen, items):
+        if self.scratch is None or self.scratch.get_size() != screen.get_size():
+            self.scratch = pygame.Surface(screen.get_size(), 0, screen)
+        for item in items:
+            if isinstance(item, StaticLayer) and item.dirty:
+                item.compose(self.scratch)
+
+    def draw_items(self, screen, items):
+        # Runs of items that are plain surfaces go to one Surface.blits() call
+        batch = []
+        for item in items:
+            blit_items = getattr(item, 'blit_items', None)
+            if blit_items is not None:
+                batch.extend(blit_items())
+                continue
+            if batch:
+                screen.blits(batch, False)
+                batch = []
+            item.draw(screen)
+        if batch:
+            screen.blits(batch, False)
+
+    def draw(self, screen):
+        items = self.get_items()
+        if self.full_redraw:
+            self.compose_layers(screen, items)
+            screen.fill(self.background_color)
+            self.draw_items(screen, items)
+            for item in items:
+                item.dirty = False
+                self.drawn_rects[item] = item.get_rect()
+            self.full_redraw = False
+            return [screen.get_rect()]
+
+        dirty_items = [item for item in items if item.dirty]
+        if not dirty_items:
+            return []
+        dirty_rects = []
+        new_rects = {}
+        for item in dirty_items:
+            rect = new_rects[item] = item.get_rect()
+            previous_rect = self.drawn_rects.get(item)
+            if previous_rect is not None and previous_rect != rect:
+                rect = rect.union(previous_rect)
+            dirty_rects.append(rect)
+        dirty_rects = self.merge_rects(dirty_rects)
+        self.compose_layers(screen, dirty_items)
+        self.drawn_rects.update(new_rects)
+
+        for rect in dirty_rects:
+            screen.set_clip(rect)
+            screen.fill(self.background_color, rect)
+            self.draw_items(screen, [item for item in items if self.drawn_rects[item].colliderect(rect)])
+        screen.set_clip(None)
+
+        for item in dirty_items:
+            item.dirty = False
+        return dirty_rects
+
+    @staticmethod
+    def merge_rects(rects):
+        # Combine overlapping rects so shared areas are not painted twice
+        merged = []
+        for rect in rects:
+            index = rect.collidelist(merged)
+            while index >= 0:
+                rect = rect.union(merged.pop(index))
+                index = rect.collidelist(merged)
+            merged.append(rect)
+        return merged
+
+
+class EventRouter:
+    """Delivers mouse events to the widgets under the pointer and key events to the focus owner."""
+
+    def __init__(self, cell_size=ROUTER_CELL_SIZE):
+        self.cell_size = cell_size
+        self.widgets = []  # In registration order, later widgets are on top
+        self.cells = {}  # (column, row) -> [(rect, widget)]
+        self.focus = None
+        self.capture = None
+
+    def register(self, *widgets):
+        for widget in widgets:
+            self.widgets.append(widget)
+            self.index(widget)
+
+    def index(self, widget):
+        rect = widget.get_rect()
+        size = self.cell_size
+        for column in range(rect.left // size, (rect.right - 1) // size + 1):
+            for row in range(rect.top // size, (rect.bottom - 1) // size + 1):
+                self.cells.setdefault((column, row), []).append((rect, widget))
+
+    def rebuild(self):
+        # After moving or resizing registered widgets
+        self.cells = {}
+        for widget in self.widgets:
+            self.index(widget)
+
+    def widgets_at(self, pos):
+        entries = self.cells.get((pos[0] // self.cell_size, pos[1] // self.cell_size), ())
+        return [widget for rect, widget in entries if rect.collidepoint(pos)]
+
+    def dispatch(self, event):
+        event_type = event.type
+        if event_type == MOUSEBUTTONDOWN:
+            targets = self.widgets_at(event.pos)
+            focus = next((widget for widget in reversed(targets) if getattr(widget, 'focusable', False)), None)
+            if self.focus is not None and self.focus not in targets:
+                self.focus.handle_event(event)  # Lets the previous owner notice it lost the focus
+            self.focus = focus
+            # The topmost widget hit gets the motion and release events until the button is let go (drags)
+            self.capture = targets[-1] if targets else None
+            for widget in targets:
+                widget.handle_event(event)
+        elif event_type == MOUSEMOTION or event_type == MOUSEBUTTONUP:
+            if self.capture is not None:
+                widget = self.capture
+                if event_type == MOUSEBUTTONUP:
+                    self.capture = None
+                widget.handle_event(event)
+            elif event_type == MOUSEBUTTONUP:
+                for widget in self.widgets_at(event.pos):
+                    widget.handle_event(event)
+        elif event_type == MOUSEWHEEL:
+            for widget in self.widgets_at(pygame.mouse.get_pos()):
+                widget.handle_event(event)
+        elif event_type in (KEYDOWN, KEYUP, TEXTINPUT):
+            if self.focus is not None:
+                self.focus.handle_event(event)
+            else:
+                # Without a focus owner keys go to the widget under the mouse, like the slider arrow keys
+                for widget in self.widgets_at(pygame.mouse.get_pos()):
+                    widget.handle_event(event)
 
 
 class SerialPlotter:
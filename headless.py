@@ -0,0 +1,82 @@
+"""Acquire, calibrate and record without a display.
+
+Uses the same acquisition pipeline as the GUI but imports nothing from pygame, for a server or Raspberry Pi:
+
+    python headless.py --meter --record binary --stats 10
+"""
+import argparse
+import time
+
+from acquisition import Acquisition, build_device_manager, read_parameters, RECORDING_SINKS
+from recorder import CsvSink
+from replay import ReplaySource
+
+# The reader threads buffer the samples, so the main loop only has to wake up a few times per second
+POLL_INTERVAL = 0.05
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="ADS1115 voltmeter acquisition without a GUI")
+    parser.add_argument("--port", action="append",
+                        help="Serial port to read (repeat for several boards, default: every ESP32 found)")
+    parser.add_argument("--replay", metavar="FILE", help="Play back a recording instead of reading devices")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="Replay speed relative to real time, 0 for as fast as possible (default 1)")
+    parser.add_argument("--parameters", default="parameters.json", help="Calibration parameters file")
+    parser.add_argument("--text", action="store_true", help="Use the text protocol instead of binary frames")
+    parser.add_argument("--meter", action="store_true", help="Switch the measurement on while running")
+    parser.add_argument("--record", choices=sorted(RECORDING_SINKS), help="Record every sample in this format")
+    parser.add_argument("--output", default=".", help="Directory for the recordings (default: current)")
+    parser.add_argument("--duration", type=float, help="Stop after this many seconds (default: until Ctrl+C)")
+    parser.add_argument("--stats", type=float, default=10.0, metavar="SECONDS",
+                        help="Print throughput statistics at this interval, 0 to disable (default 10)")
+    return parser.parse_args()
+
+
+def print_statistics(statistics, previous):
+    interval = statistics["elapsed"] - previous["elapsed"]
+    rate = (statistics["samples"] - previous["samples"]) / interval if interval > 0 else 0.0
+    print(f"{statistics['elapsed']:8.1f}s  {rate:8.1f} samples/s  {statistics['samples']} samples  "
+          f"{statistics['updates']} records")
+    for label, device in statistics["devices"].items():
+        print(f"          {label}: recorded {device['recorded']}  dropped {device['dropped']}  "
+              f"parse errors {device['parse_errors']}  lost frames {device['lost_frames']}")
+
+
+def main():
+    args = parse_arguments()
+    parameters = read_parameters(args.parameters)
+    replay_source = ReplaySource(args.replay, speed=args.speed) if args.replay else None
+    device_manager = build_device_manager(parameters, args.parameters, replay_source=replay_source,
+                                          ports=args.port)
+    acquisition = Acquisition(device_manager, directory=args.output,
+                              sink_class=RECORDING_SINKS.get(args.record, CsvSink))
+    acquisition.open(binary_mode=not args.text)
+    if args.meter:
+        device_manager.set_parameter("meter", 1)
+    if args.record:
+        acquisition.start_recording()
+
+    statistics = previous = acquisition.get_statistics()
+    next_report = time.monotonic() + args.stats
+    try:
+        while args.duration is None or statistics["elapsed"] < args.duration:
+            acquisition.poll()
+            statistics = acquisition.get_statistics()
+            if args.stats and time.monotonic() >= next_report:
+                print_statistics(statistics, previous)
+                previous = statistics
+                next_report += args.stats
+            time.sleep(POLL_INTERVAL)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        acquisition.poll()  # Hand the last samples to the recorders
+        if args.meter:
+            device_manager.set_parameter("meter", 0)
+        acquisition.close()
+        print_statistics(acquisition.get_statistics(), {"elapsed": 0.0, "samples": 0})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import numpy as np
+
+from ring_buffer import RingBuffer
+
+# Level k holds aggregates of 2**k samples, so 24 levels reach 2**23 samples per entry
+NR_OF_LEVELS = 24
+
+
+class HistoryPyramid:
+    """History of one signal at power-of-two resolutions.
+
+    Level 0 holds the raw samples. Every higher level k holds min, max and mean of consecutive blocks of 2**k
+    samples, built incrementally from pairs of level k-1 entries as samples arrive. Each level is a RingBuffer
+    of the same capacity, so memory is bounded per level while the covered time doubles with every level.
+    counts[k] is the total number of entries ever completed at level k; an entry i at level k covers samples
+    i * 2**k up to (i + 1) * 2**k.
+    """
+
+    def __init__(self, capacity, nr_of_levels=NR_OF_LEVELS):
+        self.raw = RingBuffer(capacity)
+        self.levels = [None] + [(RingBuffer(capacity), RingBuffer(capacity), RingBuffer(capacity))
+                                for _ in range(1, nr_of_levels)]
+        # Level k-1 entry waiting for its partner, as (min, max, mean) arrays of length 0 or 1
+        self.pending = [None] * nr_of_levels
+        self.counts = [0] * nr_of_levels
+        self.nr_of_levels = nr_of_levels
+
+    def __len__(self):
+        return len(self.raw)
+
+    def append(self, value):
+        self.extend((value,))
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) == 0:
+            return
+        self.raw.extend(values)
+        self.counts[0] += len(values)
+        mins = maxs = means = values
+        for level in range(1, self.nr_of_levels):
+            pending = self.pending[level]
+            if pending is not None:
+                mins = np.concatenate((pending[0], mins))
+                maxs = np.concatenate((pending[1], maxs))
+                means = np.concatenate((pending[2], means))
+            n = len(mins) // 2 * 2
+            # An odd entry out waits for the next batch
+            self.pending[level] = (mins[n:], maxs[n:], means[n:]) if n < len(mins) else None
+            if n == 0:
+                break
+            mins = np.minimum(mins[0:n:2], mins[1:n:2])
+            maxs = np.maximum(maxs[0:n:2], maxs[1:n:2])
+            means = (means[0:n:2] + means[1:n:2]) * 0.5
+            level_min, level_max, level_mean = self.levels[level]
+            level_min.extend(mins)
+            level_max.extend(maxs)
+            level_mean.extend(means)
+            self.counts[level] += len(mins)
+
+    def window(self, level, n, end=None):
+        """Return (min, max, mean) views of up to n entries of a level, ending before entry index end.
+
+        end defaults to the newest entry. At level 0 all three are the raw samples.
+        """
+        offset = 0 if end is None else max(0, self.counts[level] - end)
+        if level == 0:
+            values = self.raw.last(n, offset)
+            return values, values, values
+        level_min, level_max, level_mean = self.levels[level]
+        return level_min.last(n, offset), level_max.last(n, offset), level_mean.last(n, offset)
+
+    def clear(self):
+        self.raw.clear()
+        for level in self.levels[1:]:
+            for buffer in level:
+                buffer.clear()
+        self.pending = [None] * self.nr_of_levels
+        self.counts = [0] * self.nr_of_levels
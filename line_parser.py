@@ -0,0 +1,144 @@
+import struct
+from binascii import crc_hqx
+
+ADC_NAMES = ('adc0', 'adc1', 'adc2', 'adc3')
+# Corrupted lines should not be able to grow the name cache without bound
+MAX_CACHED_NAMES = 256
+
+# Binary frame: sync word, sequence number, four int16 channels, CRC-16/CCITT over everything before the CRC
+FRAME_FORMAT = '<HH4hH'
+FRAME_SIZE = struct.calcsize(FRAME_FORMAT)  # 14 bytes instead of ~45 for four text lines
+SYNC_WORD = 0x5AA5
+SYNC_BYTES = struct.pack('<H', SYNC_WORD)
+CRC_INIT = 0xFFFF
+
+
+def frame_crc(data):
+    return crc_hqx(data, CRC_INIT)
+
+
+def encode_frame(sequence, channels):
+    header = struct.pack('<HH4h', SYNC_WORD, sequence & 0xFFFF, *channels)
+    return header + struct.pack('<H', frame_crc(header))
+
+
+class LineParser:
+    """Turns raw serial chunks into (timestamp, name, value) records.
+
+    Bytes are accumulated in one reusable bytearray. Only complete lines are parsed; a partial line at the end
+    of a chunk stays in the buffer until the rest of it arrives. Values of the names in int_names are converted
+    straight from bytes to int, all other values are returned as str like before.
+    """
+
+    def __init__(self, int_names=ADC_NAMES):
+        self.buffer = bytearray()
+        self.errors = 0  # Number of malformed lines seen
+        # Map the raw name bytes to a shared str so every record reuses the same name object
+        self.names = {}
+        self.int_names = {name.encode() for name in int_names}
+
+    def feed(self, data, timestamp):
+        buffer = self.buffer
+        buffer += data
+        end = buffer.rfind(b'\n')
+        if end < 0:
+            return []
+        chunk = bytes(buffer[:end])
+        del buffer[:end + 1]  # Keep the partial line for the next chunk
+
+        records = []
+        self.parse_lines(chunk, timestamp, records)
+        return records
+
+    def parse_lines(self, chunk, timestamp, records):
+        append = records.append
+        names = self.names
+        int_names = self.int_names
+        for line in chunk.split(b'\n'):
+            name, separator, value = line.partition(b' ')
+            if not separator or b' ' in value:
+                if line.strip():
+                    self.errors += 1
+                    print(f"Error parameter updates. '{line}' received")
+                continue
+            parameter_name = names.get(name)
+            if parameter_name is None:
+                parameter_name = name.decode(errors='replace')
+                if len(names) < MAX_CACHED_NAMES:
+                    names[name] = parameter_name
+            if name in int_names:
+                try:
+                    append((timestamp, parameter_name, int(value)))
+                except ValueError:
+                    self.errors += 1
+                    print(f"Error parameter updates. '{line}' received")
+            else:
+                append((timestamp, parameter_name, value.decode(errors='replace').strip()))
+
+    def reset(self):
+        del self.buffer[:]
+
+
+class FrameParser(LineParser):
+    """Parser for the binary mode, where fixed-size frames and text lines share the link.
+
+    A frame starts with SYNC_BYTES, which never occur in the ASCII text lines. Runs of back-to-back frames are
+    unpacked in one struct.iter_unpack() call; a frame with a bad CRC is skipped byte by byte until the next
+    sync word. Every frame produces the same adc0..adc3 records as the text protocol.
+    """
+
+    def __init__(self, int_names=ADC_NAMES):
+        super().__init__(int_names)
+        self.channel_names = ADC_NAMES
+        self.last_sequence = None
+        self.lost_frames = 0  # Frames missing according to the sequence numbers
+        self.crc_errors = 0
+
+    def feed(self, data, timestamp):
+        buffer = self.buffer
+        buffer += data
+        size = len(buffer)
+        records = []
+        pos = 0
+        while pos < size:
+            if buffer[pos:pos + 2] == SYNC_BYTES:
+                if size - pos < FRAME_SIZE:
+                    break  # Wait for the rest of the frame
+                run = 1
+                while (pos + (run + 1) * FRAME_SIZE <= size and
+                       buffer[pos + run * FRAME_SIZE:pos + run * FRAME_SIZE + 2] == SYNC_BYTES):
+                    run += 1
+                pos = self.parse_frames(bytes(buffer[pos:pos + run * FRAME_SIZE]), timestamp, records, pos)
+                continue
+
+            newline = buffer.find(b'\n', pos)
+            sync = buffer.find(SYNC_BYTES, pos)
+            if newline >= 0 and (sync < 0 or newline < sync):
+                self.parse_lines(bytes(buffer[pos:newline]), timestamp, records)
+                pos = newline + 1
+            elif sync >= 0:
+                # Bytes in front of a frame that do not end in a newline: a corrupted or truncated line
+                self.errors += 1
+                pos = sync
+            else:
+                break  # Partial text line
+        del buffer[:pos]
+        return records
+
+    def parse_frames(self, frames, timestamp, records, pos):
+        append = records.append
+        adc0, adc1, adc2, adc3 = self.channel_names
+        for offset, (_, sequence, ch0, ch1, ch2, ch3, crc) in zip(
+                range(0, len(frames), FRAME_SIZE), struct.iter_unpack(FRAME_FORMAT, frames)):
+            if frame_crc(frames[offset:offset + FRAME_SIZE - 2]) != crc:
+                # Resynchronise on the byte after this false or damaged sync word
+                self.crc_errors += 1
+                return pos + offset + 1
+            if self.last_sequence is not None:
+                self.lost_frames += (sequence - self.last_sequence - 1) & 0xFFFF
+            self.last_sequence = sequence
+            append((timestamp, adc0, ch0))
+            append((timestamp, adc1, ch1))
+            append((timestamp, adc2, ch2))
+            append((timestamp, adc3, ch3))
+        return pos + len(frames)
@@ -1,31 +1,24 @@
 import pygame
-from graphic_interface import Slider, PushButtonPic, TextField, TerminalWindow, Label, Scope
-from serial_manager import SerialManager
-from parameter_manager import ParameterManager
+from graphic_interface import Slider, PushButtonPic, TextField, TerminalWindow, Label, Scope, DirtyRenderer, \
+    TimingOverlay, EventRouter
+from device_manager import DeviceManager
+from acquisition import Acquisition, build_device_manager, read_parameters, write_parameters, RECORDING_SINKS
+from replay import ReplaySource, SEEK_STEP
+from calibration import Calibration
+from frame_timing import FrameTimer
+from frame_pacing import FramePacer, DISPLAY_RATE
 from colors import BLACK, RED, YELLOW, BLUE, GREEN, MAGENTA, GRAY, BACKGROUNDCOLOR, DARKGREEN, SCREENGREEN
 import os
-import json
-import datetime
-import csv
 import time
+import argparse
 
 # Get the current directory of the Python file
 current_dir = os.path.dirname(__file__)
 
 CHANNEL_COLORS = [GREEN, YELLOW, RED, MAGENTA]
 CHANNEL_NAMES = ["STROOM", "BAT 1", "BAT 2", "MOTOR"]
-
-# Functie om parameters uit een bestand te lezen
-def read_parameters(file_path):
-    with open(file_path, 'r') as file:
-        return json.load(file)
-
-
-# Functie om parameters naar een bestand te schrijven
-def write_parameters(file_path, parameters):
-    with open(file_path, 'w') as file:
-        json.dump(parameters, file, indent=4)
-
+# Device state read in one batch at startup
+STARTUP_PARAMETERS = ["meter", "gain", "rate"]
 
 # Get the current directory of the Python file
 current_dir = os.path.dirname(__file__)
@@ -54,6 +47,16 @@ serial_connected = False
 PID_TARGET_OFFSET = 1
 TOLERANCE_RANGE = 1
 
+# Ask the device for the compact binary sample frames (falls back to text lines if unsupported)
+BINARY_FRAMES = True
+
+# Default file format of the REC button, see acquisition.RECORDING_SINKS
+RECORDING_FORMAT = "csv"
+
+# Seconds between updates of the frame timing overlay (F3 shows it, F4 writes the timings to a file)
+HUD_REFRESH = 0.25
+TIMING_DUMP_FILE = "frame_timing.json"
+
 # Initialize the contacts variable
 contacts = 0
 
@@ -62,14 +65,12 @@ recording = False
 rec_time = 0
 last_time = time.time()
 
-def get_param_value(name, pm, ttx, trx):
-    parameter_name, parameter_value = pm.get_parameter(name)
-    ttx.add_message(name, color=DARKGREEN)
-    trx.add_message(parameter_name + " " + parameter_value, color=DARKGREEN)
-    try:
-        return float(parameter_value)
-    except ValueError:
-        return float('nan')
+def request_param_values(names, pm, ttx, trx):
+    # All requests go out at once, so this takes about one round trip however many names there are; the replies
+    # end up in the device state mirror that the widgets read with pm.get_cached()
+    values = pm.get_parameters(names)
+    ttx.add_messages(names, color=DARKGREEN)
+    trx.add_messages([f"{name} {value}" for name, value in values.items()], color=DARKGREEN)
 
 
 def create_slider_group(origin_x, origin_y, label_text, slider_min, slider_max, slider_initial, slider_steps, font_path, font_size, label_color, slot_color, slider_color, text_field_rect_color, text_field_bg_color, text_field_passive_color, text_field_font_path, text_field_font_size):
@@ -79,7 +80,28 @@ def create_slider_group(origin_x, origin_y, label_text, slider_min, slider_max,
     return label, slider, text_field
 
 
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="ADS1115 voltmeter readout")
+    parser.add_argument("--port", action="append",
+                        help="Serial port to read, e.g. a simulator pty (repeat for several boards, "
+                             "default: every ESP32 found)")
+    parser.add_argument("--replay", metavar="FILE",
+                        help="Play back a recording (.csv or .adsrec) instead of reading the ESP32")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="Replay speed relative to real time, 0 for as fast as possible (default 1)")
+    parser.add_argument("--record-format", choices=sorted(RECORDING_SINKS), default=RECORDING_FORMAT,
+                        help=f"File format of the REC button (default {RECORDING_FORMAT})")
+    parser.add_argument("--fps", type=float, default=DISPLAY_RATE,
+                        help=f"Display rate in frames per second (default {DISPLAY_RATE})")
+    parser.add_argument("--hud", action="store_true", help="Show the frame timing overlay from the start (F3)")
+    parser.add_argument("--timing-dump", metavar="FILE",
+                        help="Write the frame timings to this JSON file on exit (F4 writes them at any time)")
+    return parser.parse_args()
+
+
 def main():
+    global rec_time, last_time, contacts
+    args = parse_arguments()
     pygame.init()
     # -----
     # Get display information
@@ -97,39 +119,35 @@ def main():
 
     window_height = round(window_height * .9)
 
-    serial_manager = SerialManager()
-    parameter_manager = ParameterManager(serial_manager)
-    # Open serial connection
-    parameter_manager.open_serial_connection()
-
-    pygame.display.set_caption("Arduino Serial Interface " + parameter_manager.get_serial_connection_name())
-
-    # Set screen to maximum resolution (90% in height)
-    screen = pygame.display.set_mode((window_width, window_height), pygame.RESIZABLE)
-
     # Bestandspad voor gain and offset parameters
     parameters_file_path = 'parameters.json'
 
     # Lees de parameters bij het starten van het programma
     parameters = read_parameters(parameters_file_path)
+    # Calibration of the first device, the one shown in and edited through the text fields
+    calibration = Calibration.from_parameters(parameters)
 
-    serial_manager = SerialManager()
-    parameter_manager = ParameterManager(serial_manager)
-    # Open serial connection
-    parameter_manager.open_serial_connection()
+    replay_source = ReplaySource(args.replay, speed=args.speed) if args.replay else None
+    # Every board gets its own reader and calibration; the others use parameters_<port>.json if present
+    device_manager = build_device_manager(parameters, parameters_file_path, calibration, replay_source, args.port)
+    multiple_devices = len(device_manager) > 1
+    # Polling, calibration and recording are shared with the headless entry point
+    acquisition = Acquisition(device_manager, sink_class=RECORDING_SINKS[args.record_format])
+    # Open serial connection(s)
+    acquisition.open(binary_mode=BINARY_FRAMES)
 
-    pygame.display.set_caption("Arduino Serial Interface " + parameter_manager.get_serial_connection_name())
+    pygame.display.set_caption("Arduino Serial Interface " + device_manager.get_serial_connection_name())
 
-    clock = pygame.time.Clock()
+    # Set screen to maximum resolution (90% in height)
+    screen = pygame.display.set_mode((window_width, window_height), pygame.RESIZABLE)
+
+    # Renders at most args.fps frames per second; the serial reader threads ingest at device speed meanwhile
+    pacer = FramePacer(args.fps)
+    received = 0  # Records taken by the previous poll
+    waited_events = []  # Event that ended the previous pacer.wait(), handled before the queued ones
     running = True
     scope = False
 
-    # Initialize adc variables
-    adc0 = 0
-    adc1 = 0
-    adc2 = 0
-    adc3 = 0
-    res_values = {}
 
 
     # callback functions
@@ -140,13 +158,13 @@ def main():
         else:
             value = 0
         terminal_tx_window.add_message("meter " + str(value), color=DARKGREEN)
-        parameter_manager.set_parameter("meter", value)
+        device_manager.set_parameter("meter", value)
 
-    def button_fast_callback(state):
-        if state:
-            my_scope.set_time_scale(-1)
-        else:
-            my_scope.set_time_scale(0)
+    def button_zoom_in_callback(state):
+        my_scope.zoom(-1)
+
+    def button_zoom_out_callback(state):
+        my_scope.zoom(1)
 
     def contact_button_callback(index, state):
         global contacts
@@ -156,7 +174,7 @@ def main():
             contacts &= ~(1 << index)  # Clear the bit at position index
 
         terminal_tx_window.add_message(f"contacts {contacts}", color=DARKGREEN)
-        parameter_manager.set_parameter(f"contacts {contacts}", contacts)
+        device_manager.set_parameter("contacts", contacts)
 
     def button_rec_callback(state):
         global recording, rec_time
@@ -168,22 +186,26 @@ def main():
 
     def rate_callback(value):
         terminal_tx_window.add_message("rate " + str(value), color=DARKGREEN)
-        parameter_manager.set_parameter("rate", value)
+        device_manager.set_parameter("rate", value)
 
     # Callback-functie voor tekstvelden
     def parameter_callback(name, value, parameters, file_path):
         parameters[name] = value
         write_parameters(file_path, parameters)
+        calibration.load_parameters(parameters)  # Swaps in the new coefficients in one step
         terminal_tx_window.add_message(f"{name} {value}", color=GREEN)
-        # parameter_manager.set_parameter(name, value)
+        # device_manager.set_parameter(name, value)
 
     # Create UI elements
     switch_on = PushButtonPic(50, 25, on_image_path, off_image_path, "meter", callback=button_callback)
 
     switch_scope_run = PushButtonPic(1200, 800, on_image_path, off_image_path, "Scope")
 
+    # Zoom the scope timebase in and out, from a few pixels per sample up to hours of history on one screen
     switch_scope_speed = PushButtonPic(1300, 800, on_image_path, off_image_path, "Time x2",
-                                       callback=button_fast_callback)
+                                       callback=button_zoom_in_callback, momentary=True)
+    switch_scope_slow = PushButtonPic(1500, 800, on_image_path, off_image_path, "Time /2",
+                                      callback=button_zoom_out_callback, momentary=True)
     switch_rec = PushButtonPic(1400, 800, on_image_path, off_image_path, "REC", font_color=RED,
                                        callback=button_rec_callback)
 
@@ -299,21 +321,39 @@ def main():
     terminal_rx_window = TerminalWindow(575, 620, 500, 270, background_color=SCREENGREEN)
 
     my_scope = Scope(1125, 20, 750, 600, dev_per_quad_x=5, dev_per_quad_y=4)
-    my_scope.add_signal(offset=0, val_per_division=10, color=CHANNEL_COLORS[0])
-    my_scope.add_signal(offset=-3, val_per_division=2, color=CHANNEL_COLORS[1])
-    my_scope.add_signal(offset=-3, val_per_division=2, color=CHANNEL_COLORS[2])
-    my_scope.add_signal(offset=-3, val_per_division=4, color=CHANNEL_COLORS[3])
-    scope_frame_complete = False
+    # Four scope channels per device; the channels of further devices are drawn in lighter colours
+    for d in range(len(device_manager)):
+        colors = [pygame.Color(color).lerp(pygame.Color('white'), min(0.8, 0.3 * d)) for color in CHANNEL_COLORS]
+        my_scope.add_signal(offset=0, val_per_division=10, color=colors[0])
+        my_scope.add_signal(offset=-3, val_per_division=2, color=colors[1])
+        my_scope.add_signal(offset=-3, val_per_division=2, color=colors[2])
+        my_scope.add_signal(offset=-3, val_per_division=4, color=colors[3])
+    # Calibrated sample arrays per scope channel, pushed to the scope once per frame
+    scope_batch = [[] for _ in range(4 * len(device_manager))]
+
+    def show_device_state():
+        # The parameter widgets follow the local mirror of the (primary) device state
+        global contacts
+        switch_on.set_state(device_manager.get_cached("meter") == "1")
+        try:
+            contacts = int(device_manager.get_cached("contacts", contacts))
+        except ValueError:
+            pass
+        for i, button in enumerate(contact_buttons):
+            button.set_state(bool(contacts & (1 << i)))
+        for name, slider in (("gain", slider_gain), ("rate", slider_rate)):
+            try:
+                value = float(device_manager.get_cached(name))
+            except (TypeError, ValueError):
+                continue
+            if value != slider.get_value():
+                slider.update_value(value)
+                slider.update_slider_position()
+                slider.is_moved()  # Not a user change: do not send the value back
 
     # Get values from device with parameter manager
-    switch_on.set_state(get_param_value("meter", parameter_manager, terminal_tx_window, terminal_rx_window))
-
-    '''
-    slider_gain.update_value(get_param_value("gain", parameter_manager, terminal_tx_window, terminal_rx_window))
-    slider_gain.update_slider_position()
-    slider_rate.update_value(get_param_value("rate", parameter_manager, terminal_tx_window, terminal_rx_window))
-    slider_rate.update_slider_position()
-    '''
+    request_param_values(STARTUP_PARAMETERS, device_manager, terminal_tx_window, terminal_rx_window)
+    show_device_state()
 
     # --------------------------
     # Define text_field_lcd
@@ -322,125 +362,146 @@ def main():
         rect_color=BLACK, font=lcd_font_path, font_size=30
     )
 
+    # Every widget is registered once, per panel; the labels and the lcd frame never change and are drawn from
+    # one cached surface per panel. Only the widgets that changed are redrawn each frame.
+    renderer = DirtyRenderer(BACKGROUNDCOLOR)
+    renderer.add_group("controls")
+    renderer.add(label_gain, label_rate, group="controls", static=True)
+    renderer.add(switch_on, slider_gain, slider_rate, text_field_gain, text_field_rate, *contact_buttons,
+                 group="controls")
+    renderer.add_group("adc")
+    renderer.add(label_adc0, label_adc1, label_adc2, label_adc3, group="adc", static=True)
+    renderer.add(label_res0, label_res1, label_res2, label_res3, group="adc", static=True)
+    renderer.add(*adc_text_fields.values(), *res_text_fields.values(), group="adc")
+    renderer.add_group("calibration")
+    renderer.add(text_field_lcd, group="calibration", static=True)
+    renderer.add(*text_fields.values(), group="calibration")
+    renderer.add_group("terminals")
+    renderer.add(terminal_tx_window, terminal_rx_window, group="terminals")
+    renderer.add_group("scope")
+    renderer.add(my_scope, switch_scope_run, switch_scope_speed, switch_scope_slow, switch_rec, group="scope")
+
+    # Widgets that take input; the read-only adc/res fields and labels never see an event
+    router = EventRouter()
+    router.register(switch_on, switch_scope_run, switch_scope_speed, switch_scope_slow, switch_rec)
+    router.register(*contact_buttons)
+    router.register(slider_gain, slider_rate)
+    router.register(*(text_field for text_field in text_fields.values() if text_field.is_editable()))
+    router.register(terminal_tx_window, terminal_rx_window, my_scope)
+
+    # Per-stage timings of the loop below, shown on top of the scope
+    frame_timer = FrameTimer()
+    my_scope.timer = frame_timer
+    for device in device_manager.devices:
+        device.timer = frame_timer
+    hud = TimingOverlay(my_scope.x + 5, my_scope.y + 5, 340, 300)
+    if args.hud:
+        hud.toggle()
+    renderer.add_group("overlay", z=1)
+    renderer.add(hud, group="overlay")
+    hud_statistics = acquisition.get_statistics()
+    next_hud_update = time.monotonic()
+
     # Drawing loop
     while running:
-        for event in pygame.event.get():
+        frame_timer.start_frame()
+        for event in waited_events + pygame.event.get():
             if event.type == pygame.QUIT:
                 running = False
-            switch_on.handle_event(event)
-            switch_scope_run.handle_event(event)
-            switch_scope_speed.handle_event(event)
-            switch_rec.handle_event(event)
-            for button in contact_buttons:
-                button.handle_event(event)
-            for name, text_field in text_fields.items():
-                text_field.handle_event(event)
-            for name, text_field in adc_text_fields.items():
-                text_field.handle_event(event)
-            slider_gain.handle_event(event)
-            slider_rate.handle_event(event)
+            elif event.type in (pygame.VIDEORESIZE, pygame.WINDOWEXPOSED):
+                renderer.invalidate()
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                hud.toggle()
+                next_hud_update = time.monotonic()
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_F4:
+                frame_timer.dump(args.timing_dump or TIMING_DUMP_FILE)
+            elif event.type == pygame.KEYDOWN and args.replay and not isinstance(router.focus, TextField):
+                # Replay controls: space pauses, page up/down seek, home restarts, +/- change the speed; not while
+                # typing in a calibration field, where - and space are part of the value
+                if event.key == pygame.K_SPACE:
+                    replay_source.toggle_pause()
+                elif event.key == pygame.K_PAGEUP:
+                    replay_source.skip(-SEEK_STEP)
+                elif event.key == pygame.K_PAGEDOWN:
+                    replay_source.skip(SEEK_STEP)
+                elif event.key == pygame.K_HOME:
+                    replay_source.seek(0)
+                elif event.key in (pygame.K_PLUS, pygame.K_KP_PLUS, pygame.K_EQUALS) and replay_source.speed:
+                    replay_source.set_speed(replay_source.speed * 2)
+                elif event.key in (pygame.K_MINUS, pygame.K_KP_MINUS) and replay_source.speed:
+                    replay_source.set_speed(replay_source.speed / 2)
+                pygame.display.set_caption(
+                    f"Arduino Serial Interface {replay_source.get_serial_connection_name()} "
+                    f"t={replay_source.get_position():.1f}s x{replay_source.speed or 'max'}"
+                    f"{' PAUSED' if replay_source.paused else ''}")
+            router.dispatch(event)
+        frame_timer.lap("events")
 
         text_field_gain.set_value(int(slider_gain.get_value()))
         text_field_rate.set_value(int(slider_rate.get_value()))
 
-        screen.fill(BACKGROUNDCOLOR)
-        slider_gain.draw(screen)
-        slider_rate.draw(screen)
-        switch_on.draw(screen)
-        switch_scope_run.draw(screen)
-        switch_scope_speed.draw(screen)
-        switch_rec.draw(screen)
-        for button in contact_buttons:
-            button.draw(screen)
-        label_gain.draw(screen)
-        label_rate.draw(screen)
-        text_field_gain.draw(screen)
-        text_field_rate.draw(screen)
-
-        label_adc0.draw(screen)
-        label_adc1.draw(screen)
-        label_adc2.draw(screen)
-        label_adc3.draw(screen)
-
-        label_res0.draw(screen)
-        label_res1.draw(screen)
-        label_res2.draw(screen)
-        label_res3.draw(screen)
-
-        for name, text_field in adc_text_fields.items():
-            text_field.draw(screen)
-        for name, text_field in res_text_fields.items():
-            text_field.draw(screen)
-        text_field_lcd.draw(screen)  # Draw text_field_lcd
-        for name, text_field in text_fields.items():
-            text_field.draw(screen)
-        terminal_tx_window.draw(screen)
-        terminal_rx_window.draw(screen)
-        if scope_frame_complete:
-            scope_frame_complete = False
-            if switch_scope_run.get_state():
-                if 'res0' in res_values:
-                    my_scope.add_data_to_signal(0, res_values['res0'])
-                if 'res1' in res_values:
-                    my_scope.add_data_to_signal(1, res_values['res1'])
-                if 'res2' in res_values:
-                    my_scope.add_data_to_signal(2, res_values['res2'])
-                if 'res3' in res_values:
-                    my_scope.add_data_to_signal(3, res_values['res3'])
-        my_scope.draw(screen)
-        pygame.display.flip()
+        # Only the widgets that changed are drawn, and at most args.fps times per second
+        if pacer.should_render(device_manager.get_backlog()):
+            if any(scope_batch):
+                if switch_scope_run.get_state():
+                    for i, batches in enumerate(scope_batch):
+                        for values in batches:
+                            my_scope.add_values_to_signal(i, values)
+                scope_batch = [[] for _ in range(4 * len(device_manager))]
+            frame_timer.lap("scope_push")
+
+            dirty_rects = renderer.draw(screen)
+            frame_timer.lap("draw")
+            if dirty_rects:
+                pygame.display.update(dirty_rects)
+            frame_timer.lap("display")
 
         if slider_gain.is_moved():
             slider_gain_val_str = str(int(slider_gain.get_value()))
             print("Current slider_gain value: " + slider_gain_val_str)
-            parameter_manager.set_parameter("gain", slider_gain_val_str)
+            device_manager.set_parameter("gain", slider_gain_val_str)
             terminal_tx_window.add_message("gain " + slider_gain_val_str, color=DARKGREEN)
 
         if slider_rate.is_moved():
             slider_rate_val_str = str(int(slider_rate.get_value()))
             print("Current slider_rate value: " + slider_rate_val_str)
-            parameter_manager.set_parameter("rate", slider_rate_val_str)
+            device_manager.set_parameter("rate", slider_rate_val_str)
             terminal_tx_window.add_message("rate " + slider_rate_val_str, color=DARKGREEN)
 
-        update_list = parameter_manager.check_parameter_updates()
-        if update_list:
-            for item in update_list:
-                parameter_name, parameter_value = item
-                terminal_rx_window.add_message(parameter_name + " " + parameter_value, color=DARKGREEN)
-                if parameter_name == "meter":
-                    if parameter_value != switch_on.get_state():
-                        if parameter_value == "1":
-                            switch_on.set_state(True)
-                        else:
-                            switch_on.set_state(False)
-                if parameter_name == "contacts":
-                    if parameter_value != switch_on.get_state():
-                        if parameter_value == "1":
-                            switch_on.set_state(True)
-                        else:
-                            switch_on.set_state(False)
-
+        # Records are queued by the serial reader threads; consume everything that arrived since the last frame
+        # Complete samples (see recorder.SAMPLE_FIELDS) are handed to the recorders' writer threads by poll()
+        acquisition.contacts = contacts
+        batches = acquisition.poll()
+        received = sum(len(batch.updates) for batch in batches)
+        frame_timer.lap("ingest")
+        if multiple_devices:
+            # One timestamp-ordered stream, each record labeled with its device
+            terminal_rx_window.add_messages([f"{label} {name} {value}" for _, label, name, value
+                                             in DeviceManager.merge_updates(batches)], color=DARKGREEN)
+        for d, batch in enumerate(batches):
+            if batch.updates and not multiple_devices:
+                terminal_rx_window.add_messages([f"{name} {value}" for _, name, value in batch.updates],
+                                                color=DARKGREEN)
+            if batch.device is device_manager.primary:
+                if batch.parameters:
+                    # Reported parameters are already in the device state mirror
+                    show_device_state()
+                if batch.updates:
+                    for i, raw_value in enumerate(batch.device.raw_sample):
+                        if raw_value is not None:
+                            adc_text_fields[f"adc{i}"].set_value(raw_value)
+
+            if batch.raw:
+                res_batch = batch.res
+                if batch.device is device_manager.primary:
+                    for i in range(4):
+                        res_text_fields[f"res{i}"].set_value(round(float(res_batch[-1, i]), 2))
                 for i in range(4):
-                    adc_name = f"adc{i}"
-                    if parameter_name == adc_name:
-                        res_name = f"res{i}"
-                        a_name = f"a{i}"
-                        b_name = f"b{i}"
-                        globals()[adc_name] = int(parameter_value)
-                        adc_text_fields[adc_name].set_value(parameter_value)
-                        # Bereken scaled_value
-                        a_value = parameters.get(a_name, 1)
-                        b_value = parameters.get(b_name, 0)
-                        scaled_value = (globals()[adc_name] - b_value)/ a_value
-                        res_text_fields[res_name].set_value(round(scaled_value, 2))
-                        res_values[res_name] = scaled_value
-                        if i == 3:
-                            scope_frame_complete = True
-                        break
+                    scope_batch[4 * d + i].append(res_batch[:, i])
+        frame_timer.lap("widgets")
 
         # Check if recording is active
         if recording:
-            global rec_time, last_time, contacts
             current_time = time.time()
             if current_time - last_time >= 1:
                 last_time = current_time
@@ -448,23 +509,17 @@ def main():
                 # Perform actions based on rec_time
                 if rec_time == 0:
                     # Perform initial actions when recording starts
-                    print("Recording started")
                     if contacts & 1:
                         contacts &= ~(1)  # Clear the 1st bit
                         terminal_tx_window.add_message(f"contacts {contacts}", color=DARKGREEN)
-                        parameter_manager.set_parameter(f"contacts {contacts}", contacts)
+                        device_manager.set_parameter("contacts", contacts)
                         contact_buttons[0].set_state(False)
-                    # Maak session_id en/of file aan
-                    current_time = datetime.datetime.now()
-                    file_name = current_time.strftime("recording_%Y%m%d_%H%M%S.csv")
-                    file = open(file_name, mode='w', newline='')
-                    writer = csv.writer(file)
-                    # Schrijf de header
-                    writer.writerow(["Timestamp", "Contacts", "voltage", "current"])
+                    # The recorder rotates to a new file by itself, it only has to be started once
+                    acquisition.start_recording()
                 elif rec_time == 1:
                     contacts |= 1  # Clear the 1st bit
                     terminal_tx_window.add_message(f"contacts {contacts}", color=DARKGREEN)
-                    parameter_manager.set_parameter(f"contacts {contacts}", contacts)
+                    device_manager.set_parameter("contacts", contacts)
                     contact_buttons[0].set_state(True)
 
                 elif rec_time % 3599 == 0:
@@ -472,24 +527,35 @@ def main():
                     print(f"Recording time: {rec_time} seconds")
                     rec_time = -1
                 rec_time += 1
-
-                # Write data to file
-                data = f"Data at {rec_time} seconds"
-                print(datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
-                print(contacts)
-                print(res_values['res0'])
-                print(res_values['res1'])
-                writer.writerow([datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"), contacts, res_values['res0'],
-                                 res_values['res1']])
-                #print(f"Recorded: {data}")
-
-        clock.tick(1000)
+        elif acquisition.is_recording():
+            acquisition.stop_recording()
+
+        if hud.visible and time.monotonic() >= next_hud_update:
+            next_hud_update = time.monotonic() + HUD_REFRESH
+            statistics = acquisition.get_statistics()
+            elapsed = statistics["elapsed"] - hud_statistics["elapsed"]
+            samples_per_second = (statistics["samples"] - hud_statistics["samples"]) / elapsed if elapsed > 0 else 0
+            hud_statistics = statistics
+            lines = [f"{'stage':<14}{'p50':>8}{'p95':>8}{'max':>8} ms"]
+            lines += [f"{stage:<14}{p50:8.2f}{p95:8.2f}{maximum:8.2f}"
+                      for stage, (p50, p95, maximum) in frame_timer.statistics().items()]
+            lines.append(f"{samples_per_second:.0f} samples/s, {pacer.skipped_frames} frames skipped")
+            lines += [f"{label}: in_waiting {device['in_waiting']} B, queued {device['queued']}"
+                      for label, device in statistics["devices"].items()]
+            hud.set_lines(lines)
+        frame_timer.lap("recording_hud")
+
+        # Nearly no CPU while the meter is off and nothing arrives; input events still wake the loop at once
+        waited_events = pacer.wait(idle=not received and not switch_on.get_state())
+        frame_timer.lap("idle")
 
     # --------------------------
 
     pygame.quit()
-    # Close the serial connection when done
-    parameter_manager.close_serial_connection()
+    if args.timing_dump:
+        frame_timer.dump(args.timing_dump)
+    # Flush and close the recordings, then the serial connections
+    acquisition.close()
 
 
 if __name__ == "__main__":
@@ -1,21 +1,46 @@
+from device_transport import DeviceTransport, REPLY_TIMEOUT
+from line_parser import ADC_NAMES
 from serial_manager import SerialManager
 
+# Firmware without binary frame support never answers the "binary" command
+BINARY_NEGOTIATION_TIMEOUT = 0.5
+
 
 class ParameterManager:
-    def __init__(self, serial_manager):
+    def __init__(self, serial_manager, reply_timeout=REPLY_TIMEOUT):
         self.serial_manager = serial_manager
         self.serial_connection = None
         self.serial_connected = False
+        # Matches replies to requests, so they never show up between the streamed updates
+        self.transport = DeviceTransport(serial_manager, reply_timeout)
+        # Last known device state: values read, sent or reported by the device, by parameter name
+        self.device_state = {}
 
-    def open_serial_connection(self):
+    def open_serial_connection(self, binary_mode=False, port=None):
         try:
-            esp32_port = self.serial_manager.find_esp32_port()
+            esp32_port = port or self.serial_manager.find_esp32_port()
             self.serial_connection = self.serial_manager.open_connection(esp32_port)
             print(f"Opened {esp32_port}")
             self.serial_connected = True
+            self.serial_manager.start_reader()
+            self.transport.start()
+            if binary_mode:
+                self.negotiate_binary_mode()
         except IOError as e:
             print(e)
 
+    def negotiate_binary_mode(self):
+        """Ask the device to stream binary frames, falling back to the text protocol if it does not agree."""
+        # Switch the parser first: frames may follow the reply immediately, and the FrameParser reads text too
+        self.serial_manager.set_binary_mode(True)
+        reply = self.transport.get("binary", command="binary 1\n", timeout=BINARY_NEGOTIATION_TIMEOUT)
+        if reply is not None and reply[2] == "1":
+            print("Binary frame mode enabled")
+            return True
+        self.serial_manager.set_binary_mode(False)
+        print("Binary frame mode not supported, using the text protocol")
+        return False
+
     def get_serial_connection_name(self):
         if self.serial_connection:
             return self.serial_connection.name
@@ -23,6 +48,10 @@ class ParameterManager:
 
     def close_serial_connection(self):
         if self.serial_connected and self.serial_connection:
+            if self.serial_manager.is_binary_mode():
+                self.set_parameter("binary", 0)  # Leave the device in the text protocol for the next session
+            self.transport.stop()
+            self.serial_manager.stop_reader()
             self.serial_connection.close()
             print("Serial connection closed.")
             self.serial_connected = False
@@ -32,33 +61,55 @@ class ParameterManager:
     def set_parameter(self, name, value):
         command = f"{name} {value}\n"
         self.serial_manager.write_to_serial(command.encode())
+        if " " not in name:  # Not a command that carries its value in the name
+            self.device_state[name] = str(value)
 
-    def get_parameter(self, name):
-        command = f"{name}\n"
-        self.serial_manager.write_to_serial(command.encode())
-        if self.serial_manager.esp32_connected:
-            try:
-                response = self.serial_manager.serial_connection.readline().decode().strip()
-            except self.serial_manager.serial_connection.serialutil.SerialException:
-                print("Timeout: No response received from the serial port")
-                return "Unexpected", None
-
-            if response:
-                parts = response.split(' ')
-                if len(parts) == 2:
-                    parameter_name, parameter_value = parts
-                    # Process the received parameter update
-                    print(f"Received parameter '{parameter_name}' = {parameter_value}")
-                    return parameter_name, parameter_value
-                else:
-                    print(f"ERROR: response does not contain 2 values: {response}")
-                    return "Unexpected", response
-            else:
-                print(f"Error receiving parameter. '{response}' received")
-                return "parameter manager error", response
-        else:
-            print(f"ESP32 not connected")
+    def get_backlog(self):
+        """Return the number of records queued by the reader thread that check_parameter_updates() did not take yet."""
+        return len(self.serial_manager.samples)
+
+    def get_cached(self, name, default=None):
+        """Return the last known value of a parameter without asking the device."""
+        return self.device_state.get(name, default)
+
+    def get_parameter(self, name, timeout=None):
+        if not self.serial_manager.esp32_connected:
+            print("ESP32 not connected")
             return name, "0"
+        if not self.transport.is_running():
+            print("Serial reader not running, cannot request parameters")
+            return "Unexpected", None
+        reply = self.transport.get(name, timeout=timeout)
+        if reply is None:
+            print(f"Timeout: No response received for '{name}'")
+            return "Unexpected", None
+        _, parameter_name, parameter_value = reply
+        print(f"Received parameter '{parameter_name}' = {parameter_value}")
+        self.device_state[parameter_name] = parameter_value
+        return parameter_name, parameter_value
+
+    def get_parameters(self, names, timeout=None):
+        """Read several parameters in one pipelined batch and return a {name: value} dict.
+
+        Parameters that are not answered within the timeout get None.
+        """
+        names = list(names)
+        if not self.serial_manager.esp32_connected:
+            print("ESP32 not connected")
+            return {name: "0" for name in names}
+        if not self.transport.is_running():
+            print("Serial reader not running, cannot request parameters")
+            return {name: None for name in names}
+        values = {}
+        for name, reply in zip(names, self.transport.get_many(names, timeout)):
+            if reply is None:
+                print(f"Timeout: No response received for '{name}'")
+                values[name] = None
+            else:
+                values[name] = reply[2]
+                self.device_state[name] = reply[2]
+        print(f"Received parameters {values}")
+        return values
 
     '''
     def get_parameter(self, name):
@@ -89,18 +140,12 @@ class ParameterManager:
     '''
 
     def check_parameter_updates(self):
-        parameter_updates = []
-        if self.serial_manager.esp32_connected:
-            while self.serial_connection.in_waiting:
-                received_data = self.serial_connection.readline().decode().strip()
-                if received_data:
-                    parts = received_data.split(' ')
-                    if len(parts) == 2:
-                        parameter_name, parameter_value = parts
-                        # Process the received parameter update
-                        print(f"Received parameter update: {parameter_name} = {parameter_value}")
-                        parameter_updates.append((parameter_name, parameter_value))
-                else:
-                    print(f"Error parameter updates. '{received_data}' received")
-
-        return parameter_updates
+        """Return all unsolicited (timestamp, name, value) records received since the previous call."""
+        if not self.serial_manager.esp32_connected:
+            return []
+        records = self.serial_manager.read_samples()
+        device_state = self.device_state
+        for _, name, value in records:
+            if name not in ADC_NAMES:
+                device_state[name] = value
+        return records
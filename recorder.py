@@ -0,0 +1,130 @@
+import csv
+import datetime
+import os
+import queue
+import threading
+import time
+
+# Column names of a sample row as handed to Recorder.add_samples()
+SAMPLE_FIELDS = ("monotonic", "contacts", "adc0", "adc1", "adc2", "adc3", "res0", "res1", "res2", "res3")
+CSV_HEADER = ["Timestamp", "Monotonic", "Contacts", "adc0", "adc1", "adc2", "adc3", "res0", "res1", "res2", "res3"]
+
+# Rows are collected in a large buffer and written to disk in big blocks
+WRITE_BUFFER_SIZE = 1 << 20
+# Start a new file when the current one reaches this size or age (None disables the limit)
+MAX_FILE_BYTES = 256 * 1024 * 1024
+MAX_FILE_SECONDS = 3600
+
+
+class CsvSink:
+    """One CSV recording file. Rows get a wall-clock timestamp derived from their monotonic timestamp."""
+
+    extension = '.csv'
+
+    def __init__(self, path, wall_clock_offset):
+        self.path = path
+        self.wall_clock_offset = wall_clock_offset
+        self.file = open(path, mode='w', newline='', buffering=WRITE_BUFFER_SIZE)
+        self.writer = csv.writer(self.file)
+        # Schrijf de header
+        self.writer.writerow(CSV_HEADER)
+
+    def write(self, samples):
+        offset = self.wall_clock_offset
+        fromtimestamp = datetime.datetime.fromtimestamp
+        self.writer.writerows(
+            (fromtimestamp(sample[0] + offset).isoformat(sep=' ', timespec='milliseconds'),) + tuple(sample)
+            for sample in samples)
+
+    def size(self):
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
+class Recorder:
+    """Records every sample to disk from a background writer thread.
+
+    The UI thread only hands over batches of sample rows (see SAMPLE_FIELDS) with add_samples(); formatting and
+    writing happen on the writer thread. Files are rotated when they get larger than max_bytes or older than
+    max_seconds, and stop() flushes and closes the current file.
+    """
+
+    def __init__(self, directory='.', prefix='recording', sink_class=CsvSink,
+                 max_bytes=MAX_FILE_BYTES, max_seconds=MAX_FILE_SECONDS):
+        self.directory = directory
+        self.prefix = prefix
+        self.sink_class = sink_class
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.queue = queue.Queue()
+        self.thread = None
+        self.recording = False
+        self.wall_clock_offset = 0.0
+        self.files = []  # Paths of all files written in this session
+        self.samples_written = 0
+
+    def is_recording(self):
+        return self.recording
+
+    def start(self):
+        if self.recording:
+            return
+        # time.time() equivalent of time.monotonic() == 0 for this session
+        self.wall_clock_offset = time.time() - time.monotonic()
+        self.recording = True
+        self.thread = threading.Thread(target=self._writer_loop, name="recorder", daemon=True)
+        self.thread.start()
+        print("Recording started")
+
+    def add_samples(self, samples):
+        if self.recording and samples:
+            self.queue.put(samples)
+
+    def stop(self):
+        if not self.recording:
+            return
+        self.recording = False
+        self.queue.put(None)  # Tells the writer to flush and close after the queued batches
+        self.thread.join()
+        self.thread = None
+        print(f"Recording stopped, {self.samples_written} samples in {len(self.files)} file(s)")
+
+    def new_file_path(self):
+        name = datetime.datetime.now().strftime(f"{self.prefix}_%Y%m%d_%H%M%S")
+        path = os.path.join(self.directory, name + self.sink_class.extension)
+        counter = 1
+        while os.path.exists(path):
+            path = os.path.join(self.directory, f"{name}_{counter}{self.sink_class.extension}")
+            counter += 1
+        return path
+
+    def open_sink(self):
+        path = self.new_file_path()
+        self.files.append(path)
+        print(f"Recording to {path}")
+        return self.sink_class(path, self.wall_clock_offset)
+
+    def _writer_loop(self):
+        sink = None
+        try:
+            sink = self.open_sink()
+            opened_at = time.monotonic()
+            while True:
+                samples = self.queue.get()
+                if samples is None:
+                    break
+                if ((self.max_bytes is not None and sink.size() >= self.max_bytes) or
+                        (self.max_seconds is not None and time.monotonic() - opened_at >= self.max_seconds)):
+                    sink.close()
+                    sink = self.open_sink()
+                    opened_at = time.monotonic()
+                sink.write(samples)
+                self.samples_written += len(samples)
+        except OSError as e:
+            print("Error writing recording:", e)
+            self.recording = False
+        finally:
+            if sink is not None:
+                sink.close()
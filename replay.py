@@ -0,0 +1,196 @@
+import csv
+import time
+
+from binary_recording import BinarySink, open_recording, load_index, find_rows
+
+# Most samples handed to the UI per check_parameter_updates() call, so a fast replay cannot stall a frame
+MAX_REPLAY_BATCH = 4096
+# Step for the seek keys, in seconds of recording time
+SEEK_STEP = 10.0
+
+
+class BinaryReplayReader:
+    """Reads a binary recording through numpy.memmap; only the rows that are replayed get paged in."""
+
+    def __init__(self, path):
+        self.records = open_recording(path)
+        self.index = load_index(path)
+        self.timestamps = self.records['monotonic']
+        self.position = 0
+        self.start_time = float(self.timestamps[0]) if len(self.records) else 0.0
+        self.end_time = float(self.timestamps[-1]) if len(self.records) else 0.0
+
+    def at_end(self):
+        return self.position >= len(self.records)
+
+    def read(self, max_rows, until=None):
+        stop = min(len(self.records), self.position + max_rows)
+        if until is not None:
+            stop = self.position + int(self.timestamps[self.position:stop].searchsorted(until, side='right'))
+        rows = self.records[self.position:stop].tolist()
+        self.position = stop
+        return rows
+
+    def count_due(self, until=None):
+        # Rows not replayed yet with a timestamp up to until (all remaining rows without until)
+        if until is None:
+            return len(self.records) - self.position
+        return int(self.timestamps[self.position:].searchsorted(until, side='right'))
+
+    def seek(self, t):
+        first, last = find_rows(self.index, t, self.end_time)
+        if first == last:
+            self.position = len(self.records) if t > self.start_time else 0
+            return
+        self.position = first + int(self.timestamps[first:last].searchsorted(t, side='left'))
+
+
+class CsvReplayReader:
+    """Reads a CSV recording line by line; seeking backwards starts again from the top of the file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.end_time = None  # Unknown without reading the whole file
+        self.file = None
+        self.open()
+        self.start_time = self.pending[0] if self.pending else 0.0
+
+    def open(self):
+        if self.file:
+            self.file.close()
+        self.file = open(self.path, newline='')
+        self.reader = csv.reader(self.file)
+        next(self.reader, None)  # Header
+        self.pending = self.next_row()
+
+    def next_row(self):
+        for row in self.reader:
+            if len(row) == 11:
+                # Timestamp, Monotonic, Contacts, adc0..adc3, res0..res3
+                return (float(row[1]), int(row[2]), int(row[3]), int(row[4]), int(row[5]), int(row[6]),
+                        float(row[7]), float(row[8]), float(row[9]), float(row[10]))
+        return None
+
+    def at_end(self):
+        return self.pending is None
+
+    def count_due(self, until=None):
+        # Unknown without reading ahead
+        return 0
+
+    def read(self, max_rows, until=None):
+        rows = []
+        while self.pending is not None and len(rows) < max_rows:
+            if until is not None and self.pending[0] > until:
+                break
+            rows.append(self.pending)
+            self.pending = self.next_row()
+        return rows
+
+    def seek(self, t):
+        if self.pending is None or self.pending[0] > t:
+            self.open()
+        while self.pending is not None and self.pending[0] < t:
+            self.pending = self.next_row()
+
+
+class ReplaySource:
+    """Plays a recording back through the same interface as ParameterManager.
+
+    check_parameter_updates() returns the recorded raw adc0..adc3 values as (timestamp, name, value) records, so
+    calibration, text fields, scope, terminals and recorder are fed exactly like from a live device. speed is
+    the playback rate relative to real time; None or 0 replays as fast as the UI takes the samples.
+    """
+
+    def __init__(self, path, speed=1.0):
+        self.path = path
+        if path.endswith(BinarySink.extension):
+            self.reader = BinaryReplayReader(path)
+        else:
+            self.reader = CsvReplayReader(path)
+        self.speed = speed or None
+        self.paused = False
+        self.serial_connected = True
+        self.current_time = self.reader.start_time  # Recording time of the last replayed sample
+        self.restart_clock()
+
+    def restart_clock(self):
+        # Map the current recording time to now; called after every pause, seek or speed change
+        self.host_anchor = time.monotonic()
+        self.recording_anchor = self.current_time
+
+    def open_serial_connection(self, binary_mode=False, port=None):
+        print(f"Replaying {self.path}")
+
+    def get_serial_connection_name(self):
+        return "REPLAY " + self.path
+
+    def close_serial_connection(self):
+        self.serial_connected = False
+
+    def set_parameter(self, name, value):
+        # There is no device to send commands to
+        pass
+
+    def get_parameter(self, name):
+        if name == "meter":
+            return name, "1"
+        return name, "0"
+
+    def get_parameters(self, names, timeout=None):
+        return {name: self.get_parameter(name)[1] for name in names}
+
+    def get_cached(self, name, default=None):
+        return self.get_parameter(name)[1]
+
+    def set_paused(self, paused):
+        self.paused = paused
+        self.restart_clock()
+
+    def toggle_pause(self):
+        self.set_paused(not self.paused)
+
+    def set_speed(self, speed):
+        self.speed = speed or None
+        self.restart_clock()
+
+    def seek(self, t):
+        """Jump to t seconds after the start of the recording."""
+        t = max(0.0, t)
+        self.reader.seek(self.reader.start_time + t)
+        self.current_time = self.reader.start_time + t
+        self.restart_clock()
+
+    def skip(self, seconds):
+        self.seek(self.get_position() + seconds)
+
+    def get_position(self):
+        return self.current_time - self.reader.start_time
+
+    def get_until(self):
+        # Recording time that should have been replayed by now, None when replaying as fast as possible
+        if self.speed is None:
+            return None
+        return self.recording_anchor + (time.monotonic() - self.host_anchor) * self.speed
+
+    def get_backlog(self):
+        """Return the number of records that are due but not replayed yet, like ParameterManager.get_backlog()."""
+        if self.paused:
+            return 0
+        return 4 * self.reader.count_due(self.get_until())
+
+    def check_parameter_updates(self):
+        if self.paused or self.reader.at_end():
+            return []
+        rows = self.reader.read(MAX_REPLAY_BATCH, self.get_until())
+        if not rows:
+            return []
+        self.current_time = rows[-1][0]
+        parameter_updates = []
+        append = parameter_updates.append
+        for timestamp, _, adc0, adc1, adc2, adc3, *_ in rows:
+            append((timestamp, 'adc0', adc0))
+            append((timestamp, 'adc1', adc1))
+            append((timestamp, 'adc2', adc2))
+            append((timestamp, 'adc3', adc3))
+        return parameter_updates
@@ -0,0 +1,64 @@
+import numpy as np
+
+
+class RingBuffer:
+    """Fixed-capacity circular buffer of samples backed by a preallocated NumPy array.
+
+    Every sample is written twice, at i and at i + capacity, so the newest n samples always form one contiguous
+    slice of the array. last(n) therefore returns a view (oldest first) without copying, append() is O(1) and
+    extend() copies a whole batch with at most two slice assignments.
+    """
+
+    def __init__(self, capacity, dtype=np.float64):
+        self.capacity = capacity
+        self.data = np.zeros(2 * capacity, dtype=dtype)
+        self.end = 0  # Index of the next write, always in [0, capacity)
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, value):
+        end = self.end
+        self.data[end] = value
+        self.data[end + self.capacity] = value
+        self.end = (end + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=self.data.dtype)
+        capacity = self.capacity
+        n = len(values)
+        if n == 0:
+            return
+        if n > capacity:
+            values = values[-capacity:]
+            n = capacity
+        end = self.end
+        first = min(n, capacity - end)
+        self.data[end:end + first] = values[:first]
+        self.data[end + capacity:end + capacity + first] = values[:first]
+        rest = n - first
+        if rest:
+            self.data[:rest] = values[first:]
+            self.data[capacity:capacity + rest] = values[first:]
+        self.end = (end + n) % capacity
+        self.count = min(self.count + n, capacity)
+
+    def last(self, n=None, offset=0):
+        """Return a read-only view of the newest n samples (all of them if n is None), oldest first.
+
+        With an offset the view ends that many samples before the newest one.
+        """
+        offset = min(offset, self.count)
+        if n is None or n > self.count - offset:
+            n = self.count - offset
+        stop = self.end + self.capacity - offset
+        view = self.data[stop - n:stop]
+        view.flags.writeable = False
+        return view
+
+    def clear(self):
+        self.end = 0
+        self.count = 0
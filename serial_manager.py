@@ -1,17 +1,46 @@
+import threading
+import time
+from collections import deque
+
+import serial
 import serial.tools.list_ports
 
+from line_parser import LineParser, FrameParser
+
+# Maximum number of (timestamp, name, value) records buffered between the reader thread and the UI
+SAMPLE_QUEUE_SIZE = 65536
+# Read timeout used by the reader thread so it can notice a stop request
+READER_TIMEOUT = 0.05
+# A write that cannot be completed within this time fails instead of blocking the caller
+WRITE_TIMEOUT = 0.5
+
 
 class SerialManager:
-    def __init__(self):
+    def __init__(self, queue_size=SAMPLE_QUEUE_SIZE, port=None):
         self.serial_connection = None
+        self.port = port  # Explicit port (e.g. a simulator pty), bypasses the search for ESP32 boards
         self.esp32_connected = False  # Track whether an ESP32 connection has been established
-
-    def find_esp32_port(self):
-        esp32_ports = [
+        # Records received by the reader thread: (host_monotonic_ts, name, value)
+        self.samples = deque(maxlen=queue_size)
+        self.dropped_samples = 0  # Records discarded because the consumer fell behind
+        self.parser = LineParser()  # Swapped for a FrameParser while the binary frame mode is active
+        # Optional callable that takes the replies to outstanding requests out of each parsed batch
+        self.reply_filter = None
+        self._reader_thread = None
+        self._reader_running = False
+
+    def find_esp32_ports(self):
+        """Return the device names of all connected ESP32 boards (Silicon Labs USB bridges)."""
+        if self.port:
+            return [self.port]
+        return [
             p.device
             for p in serial.tools.list_ports.comports()
-            if 'Silicon Labs' in p.manufacturer
+            if p.manufacturer and 'Silicon Labs' in p.manufacturer
         ]
+
+    def find_esp32_port(self):
+        esp32_ports = self.find_esp32_ports()
         if not esp32_ports:
             raise IOError("No ESP32 found")
         if len(esp32_ports) > 1:
@@ -19,8 +48,9 @@ class SerialManager:
         self.esp32_connected = True  # Set to True when ESP32 is found
         return esp32_ports[0]
 
-    def open_connection(self, port):
-        self.serial_connection = serial.Serial(port, 115200)  # 115200 is the default baud rate for ESP32
+    def open_connection(self, port, read_timeout=READER_TIMEOUT, write_timeout=WRITE_TIMEOUT):
+        # 115200 is the default baud rate for ESP32
+        self.serial_connection = serial.Serial(port, 115200, timeout=read_timeout, write_timeout=write_timeout)
         self.esp32_connected = True  # Set to True when connection is opened
         return self.serial_connection  # Return the serial connection object
 
@@ -44,6 +74,78 @@ class SerialManager:
             print("Error writing to serial port:", e)
             # Handle the error condition (e.g., retry, log, or exit gracefully)
 
+    def start_reader(self):
+        """Start the background thread that drains the serial port into self.samples."""
+        if self._reader_thread is not None:
+            return
+        if self.serial_connection is None or not self.serial_connection.is_open:
+            print("Serial connection is not open. Cannot start reader.")
+            return
+        self._reader_running = True
+        self._reader_thread = threading.Thread(target=self._reader_loop, name="serial-reader", daemon=True)
+        self._reader_thread.start()
+
+    def stop_reader(self):
+        self._reader_running = False
+        if self._reader_thread is not None:
+            self._reader_thread.join(timeout=1)
+            self._reader_thread = None
+
+    def set_binary_mode(self, enabled):
+        """Select the parser used by the reader thread; bytes not parsed yet are carried over."""
+        if enabled == self.is_binary_mode():
+            return
+        parser = FrameParser() if enabled else LineParser()
+        parser.buffer = self.parser.buffer
+        self.parser = parser
+
+    def is_binary_mode(self):
+        return isinstance(self.parser, FrameParser)
+
+    def get_backlog(self):
+        """Return (bytes waiting in the OS buffer, records queued for the consumer)."""
+        in_waiting = 0
+        connection = self.serial_connection
+        if connection is not None and connection.is_open:
+            try:
+                in_waiting = connection.in_waiting
+            except (serial.SerialException, OSError):
+                pass
+        return in_waiting, len(self.samples)
+
+    def is_reader_running(self):
+        return self._reader_thread is not None
+
+    def read_samples(self):
+        """Return all unsolicited records queued by the reader thread, oldest first."""
+        samples = self.samples
+        pop = samples.popleft
+        # Only take what is there now; the reader keeps appending on the right
+        return [pop() for _ in range(len(samples))]
+
+    def _reader_loop(self):
+        connection = self.serial_connection
+        samples = self.samples
+        while self._reader_running:
+            try:
+                # Take everything the OS has buffered in one call; block briefly for one byte when idle
+                data = connection.read(connection.in_waiting or 1)
+            except serial.SerialException as e:
+                print("Error reading from serial port:", e)
+                break
+            if not data:
+                continue
+            records = self.parser.feed(data, time.monotonic())
+            reply_filter = self.reply_filter
+            if records and reply_filter is not None:
+                records = reply_filter(records)
+            if records:
+                overflow = len(samples) + len(records) - samples.maxlen
+                if overflow > 0:
+                    self.dropped_samples += overflow
+                samples.extend(records)
+        self._reader_running = False
+
 
 '''
 class SerialManager: